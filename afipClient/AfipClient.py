@@ -1,67 +1,146 @@
+import contextlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 from LoginCms import *
-from FECompUltimoAutorizado import *
-from FECAESolicitar import *
-from FEDummy import *
-from FECompConsultar import *
-from FEParamGet import *
 from Logger import *
-from FECAEASolicitar import *
-from FECAEAConsultar import *
-from FECAEASinMovimientoInformar import *
-from FECAEASinMovimientoConsultar import *
+from OperationRegistry import *
+from WsdlCache import *
+from HttpTransport import *
+from ParamCache import *
+from FastPath import *
+from CbteNroAllocator import *
+from Resilience import *
+from Metrics import *
+from ReceiptValidator import *
+from Results import *
+from CaeJournal import *
 
 
 # AfipClient
 class AfipClient:
 
     # __init__
-    def __init__(self, type):
+    def __init__(
+        self,
+        type,
+        wsdlCache=None,
+        transport=None,
+        paramCache=None,
+        fastPath=False,
+        resilience=None,
+        metrics=None,
+        services=None,
+        loginCms=None,
+        validator=None,
+        journal=None,
+        warm=False,
+        cuit=None,
+    ):
 
         self.wsa = None
         self.wsfe = None
-        self.loginCms = None
+        self.fastPath = None
+        self.operations = None
+        self.services = services
+        self.loginCms = loginCms
+        # the taxpayer represented, when not the ticket's own
+        self.cuit = cuit
         self.type = type
+        self.regXReq = None
+        self.wsdlCache = wsdlCache or WsdlCache(type)
+        self.transport = transport or HttpTransport(cache=self.wsdlCache)
+        self.paramCache = paramCache or ParamCache(type)
+        self.resilience = resilience or Resilience()
+        self.metrics = metrics or Metrics()
+        # pre-flight checks for FECAESolicitarBatch, off unless given
+        self.validator = validator
+        # write-ahead log of FECAESolicitar, see recover()
+        self.journal = journal
 
         self.logger = Logger()
         self.prepareService()
 
+        # numbering is per taxpayer when the client or the ticket names one
+        cuit = cuit if cuit is not None else self.loginCms.cuit
+        self.scope = type if cuit is None else os.path.join(type, str(cuit))
+        self.numbers = CbteNroAllocator(self.scope, self.lastCbteNro)
+        self.operations = OperationRegistry(self.wsfe)
+
+        # reference tables are fetched on first use; warming them all up
+        # front is opt-in, it costs a round trip per table
+        if warm and services is None:
+            self.warmParams()
+
+        # pre-rendered xml for the hot operations, zeep stays the reference
+        # and the only path when the templates do not read back as sent
+        if fastPath:
+            try:
+                self.fastPath = FastPath(self.wsfe, self.transport)
+            except ValueError as e:
+                self.logger.warning("%s, using zeep", e)
+
     # buildAuth
     def buildAuth(self):
 
-        self.loginCms.getToken()
+        # one ticket reference, a refresh swaps token and sign together
+        ticket = self.loginCms.getTicket()
 
+        # a shared ticket speaks for the tenant this client represents
         auth = {
-            "Token": self.loginCms.token,
-            "Sign": self.loginCms.sign,
-            "Cuit": self.loginCms.cuit,
+            "Token": ticket.token,
+            "Sign": ticket.sign,
+            "Cuit": self.cuit if self.cuit is not None else ticket.cuit,
         }
 
         # print (auth)
         return auth
 
-    # prepareService
-    def prepareService(self):
+    # roots
+    def roots(self):
 
-        # roots
         rootWsa = "https://wsaahomo.afip.gov.ar"
         rootWsfe = "https://wswhomo.afip.gov.ar"
         if self.type == "bsdu":
             rootWsa = "http://0.0.0.0:5002"
             rootWsfe = "http://0.0.0.0:5002"
+        return rootWsa, rootWsfe
+
+    # prepareService
+    def prepareService(self):
+
+        if self.services is not None:
+            # parsed once and shared, see AfipClientPool
+            self.wsa, self.wsfe = self.services
+        else:
+            self.loadServices()
+
+        # setup wsa
+        if self.loginCms is None:
+            self.loginCms = LoginCms()
+        self.loginCms.client = self.wsa
+        self.loginCms.metrics = self.metrics
+
+    # loadServices
+    def loadServices(self):
+
+        rootWsa, rootWsfe = self.roots()
+
+        # wsa and wsfe share one pooled transport, wsdl and xsd documents
+        # come from its cache when present
+        transport = self.transport
 
         # wsa
         uriWsa = rootWsa + "/ws/services/LoginCms?wsdl"
-        self.logger.info("Loading wsa from " + uriWsa)
-        self.wsa = Client(uriWsa)
+        self.logger.info("Loading wsa from %s", uriWsa)
+        self.wsa = Client(self.wsdlCache.load(uriWsa, transport), transport=transport)
 
         # wsfe
         uriWsfe = rootWsfe + "/wsfev1/service.asmx?wsdl"
-        self.logger.info("Loading wsfe from " + uriWsfe)
-        self.wsfe = Client(uriWsfe)
+        self.logger.info("Loading wsfe from %s", uriWsfe)
+        self.wsfe = Client(self.wsdlCache.load(uriWsfe, transport), transport=transport)
 
-        # setup wsa
-        self.loginCms = LoginCms()
-        self.loginCms.client = self.wsa
+        transport.warmUp([rootWsa, rootWsfe])
 
         # self.wsa = Client('https://wsaahomo.afip.gov.ar/ws/services/LoginCms?wsdl')
         # self.wsfe = Client('https://wswhomo.afip.gov.ar/wsfev1/service.asmx?wsdl')
@@ -69,56 +148,362 @@ class AfipClient:
     # processResponse
     def processResponse(self, response):
 
-        self.logger.info(response)
+        # formatted by the log writer, and only when DEBUG is enabled
+        self.logger.debug("%s", response)
+        return response
 
-        try:
-            if response.Errors.Err[0].Code == 600:
-                self.loginCms.getNewToken()
+    # call
+    def call(self, name, fn, idempotent=True):
 
-        except:
-            None
+        # retries, re-authentication on 600 and the circuit breaker
+        with self.metrics.measure(name) as record:
+            response = self.resilience.call(fn, self.loginCms.getNewToken, idempotent)
+            record.codes = errorCodes(response)
+        return self.processResponse(response)
 
     # FECompUltimoAutorizado
-    def fECompUltimoAutorizado(self):
-        self.processResponse(self.buildObject("FECompUltimoAutorizado").run())
+    def fECompUltimoAutorizado(self, ptoVta=1, cbteTipo=1):
+        if self.fastPath is not None:
+            return self.call(
+                "FECompUltimoAutorizado",
+                lambda: self.fastPath.fECompUltimoAutorizado(self.buildAuth(), ptoVta, cbteTipo),
+            )
+        return self.call(
+            "FECompUltimoAutorizado",
+            lambda: self.buildObject("FECompUltimoAutorizado").run(ptoVta, cbteTipo),
+        )
 
     # FECAESolicitar
     def fECAESolicitar(self):
-        self.processResponse(self.buildObject("FECAESolicitar").run())
+        return self.call(
+            "FECAESolicitar",
+            lambda: self.buildObject("FECAESolicitar").run(),
+            idempotent=False,
+        )
+
+    # FECompTotXRequest
+    def fECompTotXRequest(self):
+        if self.regXReq is None:
+            response = self.fEParamGet("FECompTotXRequest")
+            self.regXReq = response.RegXReq
+        return self.regXReq
+
+    # feDetResp
+    def feDetResp(self, response, name="FECAEDetResponse"):
+        details = response.FeDetResp
+        if details is None or isinstance(details, list):
+            return details or []
+        return getattr(details, name) or []
+
+    # preflight
+    def preflight(self, cbteTipo, receipts, cbteDesde):
+
+        receipts = list(receipts)
+        if self.validator is None:
+            return [None] * len(receipts), list(range(len(receipts))), receipts
+        return self.validator.screen(cbteTipo, receipts, consecutive=cbteDesde is not None)
+
+    # FECAESolicitarBatch
+    def fECAESolicitarBatch(self, ptoVta, cbteTipo, receipts, cbteDesde=None):
+
+        # invalid receipts come back rejected without a round trip or a number
+        results, indexes, receipts = self.preflight(cbteTipo, receipts, cbteDesde)
+        try:
+            details = self.authorizeBatch(ptoVta, cbteTipo, receipts, cbteDesde)
+        except BatchError as e:
+            raise BatchError(e.error, mergeResults(results, indexes, e.results)) from e.error
+        return mergeResults(results, indexes, details)
+
+    # authorizeBatch
+    def authorizeBatch(self, ptoVta, cbteTipo, receipts, cbteDesde=None):
+
+        receipts = list(receipts)
+        results = [None] * len(receipts)
+        if not receipts:
+            return results
+
+        # numbers come from the local allocator unless given, and the key is
+        # held from allocation until they are settled
+        allocated = cbteDesde is None
+        with self.numbers.hold(ptoVta, cbteTipo) if allocated else contextlib.nullcontext():
+            if allocated:
+                cbteDesde = self.numbers.allocate(ptoVta, cbteTipo, len(receipts))
+
+            error = None
+            end = cbteDesde + len(receipts) - 1 if allocated else None
+            size = self.fECompTotXRequest()
+            for start in range(0, len(receipts), size):
+
+                chunk = receipts[start : start + size]
+                first = cbteDesde + start
+                try:
+                    with self.journaling(ptoVta, cbteTipo, first, len(chunk), end):
+                        response = self.sendChunk(ptoVta, cbteTipo, chunk, first)
+                except Exception as e:
+                    # earlier chunks keep their CAEs, this one is in doubt
+                    # and the rest is not sent
+                    error = e
+                    if self.wasSent(e):
+                        self.markInDoubt(results, start, len(chunk), first)
+                    break
+
+                # numbers after a rejection are no longer consecutive, stop here
+                if not self.matchDetails(response, results, cbteDesde):
+                    break
+
+            if allocated:
+                self.settleNumbers(ptoVta, cbteTipo, results, cbteDesde)
+
+        if error is not None:
+            self.logger.warning(
+                "FECAESolicitar %d-%d stopped at %d: %s", ptoVta, cbteTipo, first, error
+            )
+            raise BatchError(error, results) from error
+        return results
+
+    # sendChunk
+    def sendChunk(self, ptoVta, cbteTipo, chunk, cbteDesde):
+        if self.fastPath is not None:
+            return self.call(
+                "FECAESolicitar",
+                lambda: self.fastPath.fECAESolicitar(
+                    self.buildAuth(), ptoVta, cbteTipo, chunk, cbteDesde
+                ),
+                idempotent=False,
+            )
+        return self.call(
+            "FECAESolicitar",
+            lambda: self.buildObject("FECAESolicitar").runBatch(ptoVta, cbteTipo, chunk, cbteDesde),
+            idempotent=False,
+        )
+
+    # wasSent
+    def wasSent(self, error):
+        # an open circuit or a request zeep or the fast path would not
+        # render never left the process
+        return not isinstance(error, (CircuitOpenError, TypeError))
+
+    # markInDoubt
+    def markInDoubt(self, results, start, count, cbteDesde):
+        for i in range(count):
+            results[start + i] = CaeDetail(cbteDesde + i, cbteDesde + i, IN_DOUBT, None, None, None)
+
+    # lastCbteNro
+    def lastCbteNro(self, ptoVta, cbteTipo):
+        return self.fECompUltimoAutorizado(ptoVta, cbteTipo).CbteNro
+
+    # journaling
+    def journaling(self, ptoVta, cbteTipo, cbteDesde, count, end):
+        if self.journal is None:
+            return contextlib.nullcontext()
+        return self.journal.sending(ptoVta, cbteTipo, cbteDesde, count, end)
+
+    # recover
+    def recover(self, concurrency=8):
+
+        # sends in doubt, from a process that died or a response that never
+        # arrived, are resolved through the service and never sent again:
+        # numbers past FECompUltimoAutorizado were not authorized, the rest
+        # are looked up with FECompConsultar. Returns (ptoVta, cbteTipo,
+        # results) per resolved send, results as for FECAESolicitarBatch
+        if self.journal is None:
+            return []
+
+        groups = {}
+        for entry in self.journal.doubtful():
+            groups.setdefault((entry["ptoVta"], entry["cbteTipo"]), []).append(entry)
+
+        recovered = []
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for (ptoVta, cbteTipo), entries in groups.items():
+                last = self.lastCbteNro(ptoVta, cbteTipo)
+                consults = {}
+                for entry in entries:
+                    for cbteNro in journalNumbers(entry):
+                        if cbteNro <= last:
+                            consults[cbteNro] = executor.submit(
+                                self.fECompConsultar, ptoVta, cbteTipo, cbteNro
+                            )
+                for entry in entries:
+                    results = self.resolve(entry, last, consults)
+                    if results is not None:
+                        recovered.append((ptoVta, cbteTipo, results))
+        return recovered
+
+    # resolve
+    def resolve(self, entry, last, consults):
+
+        # results of one send in doubt, None when the service could not tell
+        ptoVta, cbteTipo, cbteDesde = entry["ptoVta"], entry["cbteTipo"], entry["cbteDesde"]
+        results = []
+        for cbteNro in journalNumbers(entry):
+            if cbteNro > last:
+                results.append(None)
+                continue
+            try:
+                response = consults[cbteNro].result()
+            except Exception as e:
+                self.logger.warning("Could not resolve %d-%d-%d: %s", ptoVta, cbteTipo, cbteNro, e)
+                return None
+            codes = errorCodes(response)
+            if codes and not set(codes) <= set(NOT_FOUND_ERRORS):
+                self.logger.warning("Could not resolve %d-%d-%d: %s", ptoVta, cbteTipo, cbteNro, codes)
+                return None
+            if codes:
+                results.append(None)
+                continue
+            result = response.ResultGet
+            results.append(
+                CaeDetail(
+                    cbteNro, cbteNro, result.Resultado, result.CodAutorizacion, result.FchVto, None
+                )
+            )
+
+        self.journal.end(entry["id"])
+        if entry["end"] is not None:
+            self.settleNumbers(ptoVta, cbteTipo, results, cbteDesde, entry["end"])
+        self.logger.info(
+            "Recovered %d-%d %d..%d, %d authorized",
+            ptoVta,
+            cbteTipo,
+            cbteDesde,
+            cbteDesde + entry["count"] - 1,
+            sum(1 for r in results if r is not None and r.Resultado == "A"),
+        )
+        return CaeResults(results)
+
+    # settleNumbers
+    def settleNumbers(self, ptoVta, cbteTipo, results, cbteDesde, end=None):
+
+        # AFIP disagrees with our sequence, start over from its last number
+        if any(r is not None and self.numbers.isNumberingError(r) for r in results):
+            self.numbers.resync(ptoVta, cbteTipo)
+            return
+
+        # numbers sent without an answer stay taken until recover()
+        # resolves them, it hands back what the service never saw
+        if any(r is not None and r.Resultado == IN_DOUBT for r in results):
+            return
+
+        # give back the numbers of receipts that were never authorized
+        used = cbteDesde - 1
+        for result in results:
+            if result is None or result.Resultado != "A":
+                break
+            used = result.CbteDesde
+        if end is None:
+            end = cbteDesde + len(results) - 1
+        if used < end:
+            self.numbers.release(ptoVta, cbteTipo, end, used)
+
+    # matchDetails
+    def matchDetails(self, response, results, cbteDesde):
+
+        # match each detail back to its input through the receipt number
+        details = self.feDetResp(response)
+        approved = len(details) > 0
+        for detail in details:
+            index = detail.CbteDesde - cbteDesde
+            if 0 <= index < len(results):
+                results[index] = compactDetail(detail)
+            if detail.Resultado != "A":
+                approved = False
+        return approved
 
     # FECompConsultar
-    def fECompConsultar(self):
-        self.processResponse(self.buildObject("FECompConsultar").run())
+    def fECompConsultar(self, ptoVta=1, cbteTipo=1, cbteNro=1):
+        response = self.call(
+            "FECompConsultar",
+            lambda: self.buildObject("FECompConsultar").run(ptoVta, cbteTipo, cbteNro),
+        )
+        return compactConsult(response)
 
     # FECAEASolicitar
-    def fECAEASolicitar(self):
-        self.processResponse(self.buildObject("FECAEASolicitar").run())
+    def fECAEASolicitar(self, periodo="202109", orden=1):
+        return self.call(
+            "FECAEASolicitar",
+            lambda: self.buildObject("FECAEASolicitar").run(periodo, orden),
+        )
+
+    # FECAEARegInformativo
+    def fECAEARegInformativo(self, ptoVta, cbteTipo, details):
+        return self.call(
+            "FECAEARegInformativo",
+            lambda: self.buildObject("FECAEARegInformativo").run(ptoVta, cbteTipo, details),
+            idempotent=False,
+        )
 
     # fECAEAConsultar
-    def fECAEAConsultar(self):
-        self.processResponse(self.buildObject("FECAEAConsultar").run())
+    def fECAEAConsultar(self, periodo="202109", orden=1):
+        return self.call(
+            "FECAEAConsultar",
+            lambda: self.buildObject("FECAEAConsultar").run(periodo, orden),
+        )
 
     # FECAEASinMovimientoInformar
     def fECAEASinMovimientoInformar(self):
-        self.processResponse(self.buildObject("FECAEASinMovimientoInformar").run())
+        return self.call(
+            "FECAEASinMovimientoInformar",
+            lambda: self.buildObject("FECAEASinMovimientoInformar").run(),
+            idempotent=False,
+        )
 
     # FECAEASinMovimientoConsultar
     def fECAEASinMovimientoConsultar(self):
-        self.processResponse(self.buildObject("FECAEASinMovimientoConsultar").run())
+        return self.call(
+            "FECAEASinMovimientoConsultar",
+            lambda: self.buildObject("FECAEASinMovimientoConsultar").run(),
+        )
 
     # buildObject
     def buildObject(self, className):
-        module = __import__(className)
-        class_ = getattr(module, className)
-        obj = class_()
-        obj.setAuth(self.buildAuth())
-        obj.setClient(self.wsfe)
-        return obj
+        return self.operations.get(className).bind(self.buildAuth())
+
+    # warmParams
+    def warmParams(self):
+        # best effort, a service that is down must not open the circuit
+        self.paramCache.warm(lambda param: self.fetchTable(param, self.probeParam))
+
+    # probeParam
+    def probeParam(self, param):
+        with self.metrics.measure("FEParamGet"):
+            return self.buildObject("FEParamGet").run(param)
+
+    # fetchParam
+    def fetchParam(self, param):
+        return self.call("FEParamGet", lambda: self.buildObject("FEParamGet").run(param))
+
+    # answered
+    def answered(self, error):
+        # the service replied, with a fault or with something zeep cannot read
+        return not isinstance(error, CircuitOpenError) and self.resilience.classify(error) == PERMANENT
+
+    # fetchTable
+    def fetchTable(self, param, fetch=None):
+
+        # a reply that is not a table is cached as a negative entry, see
+        # ParamCache.store; not reaching the service is not
+        try:
+            return (fetch or self.fetchParam)(param)
+        except Exception as e:
+            if not self.answered(e):
+                raise
+            self.logger.warning("%s answered without a table: %s", param, e)
+            return None
 
     # FEParamGet
     def fEParamGet(self, param):
-        self.processResponse(self.buildObject("FEParamGet").run(param))
+
+        # reference tables come back as the rows valid today
+        if self.paramCache.isCached(param):
+            return self.paramCache.valid(self.paramCache.table(param, self.fetchTable))
+        return self.fetchParam(param)
+
+    # FEParamLookup
+    def fEParamLookup(self, param, id):
+        self.paramCache.table(param, self.fetchTable)
+        return self.paramCache.lookup(param, id)
 
     # FEDummy
     def fEDummy(self):
-        self.processResponse(self.buildObject("FEDummy").run())
+        return self.call("FEDummy", lambda: self.buildObject("FEDummy").run())
@@ -0,0 +1,129 @@
+import collections
+import hashlib
+import os
+import threading
+
+from AfipClient import *
+
+
+# AfipClientPool
+class AfipClientPool:
+
+    # __init__
+    def __init__(
+        self,
+        type,
+        maxClients=100,
+        service="wsfe",
+        certificate="curl/MiCertificado.pem",
+        privateKey="curl/MiClavePrivada.key",
+        taDir="cache/ta",
+    ):
+
+        self.type = type
+        self.maxClients = maxClients
+        self.service = service
+        self.certificate = certificate
+        self.privateKey = privateKey
+        self.taDir = os.path.join(taDir, type)
+        self.logger = Logger()
+
+        # shared by every tenant
+        self.wsdlCache = WsdlCache(type)
+        self.transport = HttpTransport(cache=self.wsdlCache)
+        self.paramCache = ParamCache(type)
+        self.resilience = Resilience()
+        self.metrics = Metrics()
+        self.services = None
+
+        self._credentials = {}
+        self._signers = {}
+        self._tickets = {}
+        self._clients = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    # register
+    def register(self, cuit, certificate, privateKey):
+        # a taxpayer signing with its own certificate instead of the pool's
+        with self._lock:
+            self._credentials[str(cuit)] = (certificate, privateKey)
+
+    # credentials
+    def credentials(self, cuit):
+        return self._credentials.get(cuit, (self.certificate, self.privateKey))
+
+    # signer
+    def signer(self, credentials):
+
+        # one signer per certificate, the key is parsed once
+        signer = self._signers.get(credentials)
+        if signer is None:
+            signer = self._signers[credentials] = CmsSigner(*credentials)
+        return signer
+
+    # ticket
+    def ticket(self, credentials):
+
+        # one ticket per certificate and service, shared by every tenant it
+        # represents: WSAA answers coe.alreadyAuthenticated to a second
+        # loginCms while the first ticket is valid. Renewed on first use
+        # after expiry, no timer per certificate
+        loginCms = self._tickets.get(credentials)
+        if loginCms is None:
+            certificate = credentials[0]
+            name = "%s-%s-%s.xml" % (
+                os.path.splitext(os.path.basename(certificate))[0],
+                hashlib.sha1(os.path.abspath(certificate).encode()).hexdigest()[:8],
+                self.service,
+            )
+            loginCms = self._tickets[credentials] = LoginCms(
+                service=self.service,
+                taFile=os.path.join(self.taDir, name),
+                signer=self.signer(credentials),
+                proactive=False,
+            )
+        return loginCms
+
+    # build
+    def build(self, cuit):
+
+        client = AfipClient(
+            self.type,
+            self.wsdlCache,
+            self.transport,
+            self.paramCache,
+            resilience=self.resilience,
+            metrics=self.metrics,
+            services=self.services,
+            loginCms=self.ticket(self.credentials(cuit)),
+            cuit=cuit,
+        )
+        if self.services is None:
+            self.services = (client.wsa, client.wsfe)
+        return client
+
+    # get
+    def get(self, cuit):
+
+        cuit = str(cuit)
+        with self._lock:
+            client = self._clients.get(cuit)
+            if client is not None:
+                self._clients.move_to_end(cuit)
+                return client
+
+            client = self._clients[cuit] = self.build(cuit)
+            while len(self._clients) > self.maxClients:
+                self.evict()
+        return client
+
+    # evict
+    def evict(self):
+
+        # the ticket is shared with the certificate's other tenants
+        cuit, client = self._clients.popitem(last=False)
+        self.logger.debug("Evicting client for %s", cuit)
+
+    # __len__
+    def __len__(self):
+        return len(self._clients)
@@ -0,0 +1,324 @@
+import asyncio
+import contextlib
+
+from AfipClient import *
+from zeep import AsyncClient
+from zeep.transports import AsyncTransport
+
+
+# MeteredAsyncTransport
+class MeteredAsyncTransport(AsyncTransport):
+
+    # post
+    async def post(self, address, message, headers):
+        response = await super().post(address, message, headers)
+        recordTransfer(len(message), len(response.content))
+        return response
+
+
+# AsyncAfipClient
+class AsyncAfipClient(AfipClient):
+
+    # __init__
+    def __init__(
+        self,
+        type,
+        concurrency=20,
+        perPtoVta=4,
+        wsdlCache=None,
+        transport=None,
+        metrics=None,
+    ):
+
+        self.asyncTransport = None
+        self._loop = None
+        self.concurrency = concurrency
+        self.perPtoVta = perPtoVta
+        self._global = asyncio.Semaphore(concurrency)
+        self._ptoVta = {}
+        self._holds = {}
+        super().__init__(type, wsdlCache, transport, metrics=metrics)
+
+    # prepareService
+    def prepareService(self):
+
+        # wsa and loginCms stay synchronous, renewals are rare
+        super().prepareService()
+        rootWsa, rootWsfe = self.roots()
+
+        uriWsfe = rootWsfe + "/wsfev1/service.asmx?wsdl"
+        self.asyncTransport = MeteredAsyncTransport(cache=self.wsdlCache)
+        self.wsfe = AsyncClient(
+            self.wsdlCache.load(uriWsfe, self.transport), transport=self.asyncTransport
+        )
+
+    # limit
+    @contextlib.asynccontextmanager
+    async def limit(self, ptoVta=None):
+
+        if ptoVta is None:
+            async with self._global:
+                yield
+            return
+
+        # wait for the point of sale first so it never holds a global slot idle
+        semaphore = self._ptoVta.get(ptoVta)
+        if semaphore is None:
+            semaphore = self._ptoVta[ptoVta] = asyncio.Semaphore(self.perPtoVta)
+
+        async with semaphore:
+            async with self._global:
+                yield
+
+    # ensureToken
+    async def ensureToken(self):
+        if not self.loginCms.isValid():
+            await asyncio.to_thread(self.loginCms.getToken)
+
+    # send
+    async def send(self, ptoVta, className, method, *args, idempotent=True):
+
+        async with self.limit(ptoVta):
+            await self.ensureToken()
+            with self.metrics.measure(className) as record:
+                response = await self.resilience.callAsync(
+                    lambda: getattr(self.buildObject(className), method)(*args),
+                    self.loginCms.getNewToken,
+                    idempotent,
+                )
+                record.codes = errorCodes(response)
+            return self.processResponse(response)
+
+    # close
+    async def close(self):
+        await self.asyncTransport.aclose()
+
+    # FECompUltimoAutorizado
+    async def fECompUltimoAutorizado(self, ptoVta=1, cbteTipo=1):
+        return await self.send(ptoVta, "FECompUltimoAutorizado", "run", ptoVta, cbteTipo)
+
+    # FECAESolicitar
+    async def fECAESolicitar(self):
+        return await self.send(None, "FECAESolicitar", "run", idempotent=False)
+
+    # FECompTotXRequest
+    async def fECompTotXRequest(self):
+        if self.regXReq is None:
+            response = await self.fEParamGet("FECompTotXRequest")
+            self.regXReq = response.RegXReq
+        return self.regXReq
+
+    # FECAESolicitarBatch
+    async def fECAESolicitarBatch(self, ptoVta, cbteTipo, receipts, cbteDesde=None):
+
+        results, indexes, receipts = self.preflight(cbteTipo, receipts, cbteDesde)
+        try:
+            details = await self.authorizeBatch(ptoVta, cbteTipo, receipts, cbteDesde)
+        except BatchError as e:
+            raise BatchError(e.error, mergeResults(results, indexes, e.results)) from e.error
+        return mergeResults(results, indexes, details)
+
+    # authorizeBatch
+    async def authorizeBatch(self, ptoVta, cbteTipo, receipts, cbteDesde=None):
+
+        receipts = list(receipts)
+        results = [None] * len(receipts)
+        if not receipts:
+            return results
+
+        # the allocator blocks on its file lock, keep it off the event loop
+        self._loop = asyncio.get_running_loop()
+        if cbteDesde is not None:
+            error = await self.sendBatch(ptoVta, cbteTipo, receipts, results, cbteDesde, False)
+            return self.batchResults(ptoVta, cbteTipo, results, error)
+
+        # the key is held from allocation until the numbers are settled;
+        # batches of this process queue on the loop first so waiting ones
+        # do not tie up the worker threads the holder needs
+        lock = self._holds.get((ptoVta, cbteTipo))
+        if lock is None:
+            lock = self._holds[(ptoVta, cbteTipo)] = asyncio.Lock()
+        async with lock:
+            hold = self.numbers.hold(ptoVta, cbteTipo)
+            acquiring = asyncio.ensure_future(asyncio.to_thread(hold.acquire))
+            try:
+                await asyncio.shield(acquiring)
+            except asyncio.CancelledError:
+                # the thread still takes the hold, give it back once it has
+                acquiring.add_done_callback(lambda f: f.exception() is None and hold.release())
+                raise
+            try:
+                cbteDesde = await asyncio.to_thread(
+                    self.numbers.allocate, ptoVta, cbteTipo, len(receipts)
+                )
+                error = await self.sendBatch(ptoVta, cbteTipo, receipts, results, cbteDesde, True)
+                await asyncio.to_thread(self.settleNumbers, ptoVta, cbteTipo, results, cbteDesde)
+            finally:
+                hold.release()
+        return self.batchResults(ptoVta, cbteTipo, results, error)
+
+    # batchResults
+    def batchResults(self, ptoVta, cbteTipo, results, error):
+        if error is None:
+            return results
+        self.logger.warning("FECAESolicitar %d-%d stopped: %s", ptoVta, cbteTipo, error)
+        raise BatchError(error, results) from error
+
+    # sendBatch
+    async def sendBatch(self, ptoVta, cbteTipo, receipts, results, cbteDesde, allocated):
+
+        # chunks of one point of sale go out in order, numbering depends on
+        # it; returns the error that stopped them, see AfipClient.authorizeBatch
+        end = cbteDesde + len(receipts) - 1 if allocated else None
+        size = await self.fECompTotXRequest()
+        for start in range(0, len(receipts), size):
+
+            chunk = receipts[start : start + size]
+            id = None
+            if self.journal is not None:
+                id = await asyncio.to_thread(
+                    self.journal.begin, ptoVta, cbteTipo, cbteDesde + start, len(chunk), end
+                )
+            try:
+                response = await self.send(
+                    ptoVta,
+                    "FECAESolicitar",
+                    "runBatch",
+                    ptoVta,
+                    cbteTipo,
+                    chunk,
+                    cbteDesde + start,
+                    idempotent=False,
+                )
+            except BaseException as e:
+                if id is not None:
+                    self.journal.fail(id)
+                if not isinstance(e, Exception):
+                    raise
+                if self.wasSent(e):
+                    self.markInDoubt(results, start, len(chunk), cbteDesde + start)
+                return e
+            if id is not None:
+                await asyncio.to_thread(self.journal.end, id)
+            if not self.matchDetails(response, results, cbteDesde):
+                break
+        return None
+
+    # recover
+    async def recover(self):
+
+        # see AfipClient.recover, lookups are bounded by limit()
+        if self.journal is None:
+            return []
+
+        groups = {}
+        for entry in await asyncio.to_thread(self.journal.doubtful):
+            groups.setdefault((entry["ptoVta"], entry["cbteTipo"]), []).append(entry)
+
+        recovered = []
+        for (ptoVta, cbteTipo), entries in groups.items():
+            last = (await self.fECompUltimoAutorizado(ptoVta, cbteTipo)).CbteNro
+            consults = {}
+            for entry in entries:
+                for cbteNro in journalNumbers(entry):
+                    if cbteNro <= last:
+                        consults[cbteNro] = asyncio.ensure_future(
+                            self.fECompConsultar(ptoVta, cbteTipo, cbteNro)
+                        )
+            if consults:
+                await asyncio.wait(consults.values())
+            for entry in entries:
+                results = await asyncio.to_thread(self.resolve, entry, last, consults)
+                if results is not None:
+                    recovered.append((ptoVta, cbteTipo, results))
+        return recovered
+
+    # lastCbteNro
+    def lastCbteNro(self, ptoVta, cbteTipo):
+        # called by the allocator from a worker thread
+        future = asyncio.run_coroutine_threadsafe(
+            self.fECompUltimoAutorizado(ptoVta, cbteTipo), self._loop
+        )
+        return future.result().CbteNro
+
+    # FECompConsultar
+    async def fECompConsultar(self, ptoVta=1, cbteTipo=1, cbteNro=1):
+        response = await self.send(ptoVta, "FECompConsultar", "run", ptoVta, cbteTipo, cbteNro)
+        return compactConsult(response)
+
+    # FECAEASolicitar
+    async def fECAEASolicitar(self, periodo="202109", orden=1):
+        return await self.send(None, "FECAEASolicitar", "run", periodo, orden)
+
+    # fECAEAConsultar
+    async def fECAEAConsultar(self, periodo="202109", orden=1):
+        return await self.send(None, "FECAEAConsultar", "run", periodo, orden)
+
+    # FECAEASinMovimientoInformar
+    async def fECAEASinMovimientoInformar(self):
+        return await self.send(None, "FECAEASinMovimientoInformar", "run", idempotent=False)
+
+    # FECAEASinMovimientoConsultar
+    async def fECAEASinMovimientoConsultar(self):
+        return await self.send(None, "FECAEASinMovimientoConsultar", "run")
+
+    # warmParams
+    def warmParams(self):
+        # tables are warmed from the event loop, see warm()
+        None
+
+    # warm
+    async def warm(self):
+
+        # best effort, outside the circuit breaker like AfipClient.warmParams
+        stale = [param for param in PARAM_TABLES if self.paramCache.fresh(param) is None]
+        if not stale:
+            return
+        await self.ensureToken()
+        results = await asyncio.gather(*[self.probeParam(p) for p in stale], return_exceptions=True)
+        for param, result in zip(stale, results):
+            if not isinstance(result, Exception):
+                self.paramCache.store(param, result)
+            elif self.answered(result):
+                # a negative entry, see ParamCache.store
+                self.paramCache.store(param, None)
+            else:
+                self.logger.warning("Could not warm %s: %s", param, result)
+
+    # probeParam
+    async def probeParam(self, param):
+        async with self.limit():
+            with self.metrics.measure("FEParamGet"):
+                return await self.buildObject("FEParamGet").run(param)
+
+    # FEParamGet
+    async def fEParamGet(self, param):
+
+        if not self.paramCache.isCached(param):
+            return await self.send(None, "FEParamGet", "run", param)
+
+        table = self.paramCache.fresh(param)
+        if table is not None:
+            return self.paramCache.valid(table)
+
+        try:
+            response = await self.send(None, "FEParamGet", "run", param)
+        except Exception as e:
+            if not self.answered(e):
+                # serve the stale copy while AFIP is unreachable
+                table = self.paramCache.cached(param)
+                if table is None:
+                    raise
+                return self.paramCache.valid(table)
+            self.logger.warning("%s answered without a table: %s", param, e)
+            response = None
+        return self.paramCache.valid(self.paramCache.store(param, response))
+
+    # FEParamLookup
+    async def fEParamLookup(self, param, id):
+        await self.fEParamGet(param)
+        return self.paramCache.lookup(param, id)
+
+    # FEDummy
+    async def fEDummy(self):
+        return await self.send(None, "FEDummy", "run")
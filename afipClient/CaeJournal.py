@@ -0,0 +1,202 @@
+import contextlib
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+
+from Logger import *
+
+# rewrite the journal with only the open sends past this size
+COMPACT_SIZE = 1 << 20
+
+
+# journalNumbers
+def journalNumbers(entry):
+    return range(entry["cbteDesde"], entry["cbteDesde"] + entry["count"])
+
+
+# CaeJournal
+class CaeJournal:
+
+    # __init__
+    def __init__(self, scope, dir="cache/cae", settle=60):
+
+        # write-ahead log of FECAESolicitar: a send record is durable before
+        # the request goes out, a done record follows once the response is
+        # read. One file per process, locked while open; a file nobody holds
+        # belongs to a process that died and its open sends are adopted.
+        # settle: seconds before a send without an answer is in doubt, the
+        # service may still be processing it
+        self.dir = os.path.join(dir, scope)
+        self.file = os.path.join(self.dir, "%d-%s.jsonl" % (os.getpid(), uuid.uuid4().hex[:8]))
+        self.settle = settle
+        self.logger = Logger()
+        self._open = {}
+        self._doubt = set()
+        self._lock = threading.Lock()
+
+        os.makedirs(self.dir, exist_ok=True)
+        self._f = self.create(self.file)
+
+    # create
+    def create(self, file):
+
+        # locked before it gets a name others look for
+        tmp = file + ".new"
+        f = open(tmp, "a")
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        os.replace(tmp, file)
+        return f
+
+    # read
+    def read(self, f):
+
+        # open sends of a journal, a record torn by a crash is dropped
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            self.logger.warning("Dropping incomplete journal record")
+
+        sends = {}
+        for line in data[:end].splitlines():
+            record = json.loads(line)
+            if record["op"] == "send":
+                sends[record["id"]] = record
+            else:
+                sends.pop(record["id"], None)
+        return sends
+
+    # write
+    def write(self, records):
+
+        # one fsync per call, the record is durable before we return
+        data = "".join(json.dumps(r) + "\n" for r in records)
+        self._f.write(data)
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    # begin
+    def begin(self, ptoVta, cbteTipo, cbteDesde, count, end=None):
+
+        # end: last number allocated with this one, handed back on recovery
+        # when the service never saw them
+        record = {
+            "op": "send",
+            "id": uuid.uuid4().hex,
+            "at": time.time(),
+            "ptoVta": ptoVta,
+            "cbteTipo": cbteTipo,
+            "cbteDesde": cbteDesde,
+            "count": count,
+            "end": end,
+        }
+        with self._lock:
+            self.write([record])
+            self._open[record["id"]] = record
+        return record["id"]
+
+    # end
+    def end(self, id):
+
+        with self._lock:
+            self.write([{"op": "done", "id": id}])
+            self._open.pop(id, None)
+            self._doubt.discard(id)
+            if self._f.tell() > COMPACT_SIZE:
+                self.compact()
+
+    # fail
+    def fail(self, id):
+
+        # no response, the send may or may not have been authorized
+        with self._lock:
+            self._doubt.add(id)
+
+    # sending
+    @contextlib.contextmanager
+    def sending(self, ptoVta, cbteTipo, cbteDesde, count, end=None):
+
+        id = self.begin(ptoVta, cbteTipo, cbteDesde, count, end)
+        try:
+            yield id
+        except BaseException:
+            self.fail(id)
+            raise
+        self.end(id)
+
+    # adopt
+    def adopt(self):
+
+        # open sends of dead processes move to our journal, then their file goes
+        for file in glob.glob(os.path.join(self.dir, "*.jsonl")):
+            if file == self.file:
+                continue
+            try:
+                f = open(file, "rb")
+            except FileNotFoundError:
+                continue
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # its process is alive
+                f.close()
+                continue
+
+            # adopted by someone else between the listing and the lock
+            if os.fstat(f.fileno()).st_nlink == 0:
+                f.close()
+                continue
+
+            sends = self.read(f)
+            with self._lock:
+                if sends:
+                    self.write(list(sends.values()))
+                self._open.update(sends)
+                self._doubt.update(sends)
+            if sends:
+                self.logger.warning("Adopted %d unanswered sends from %s", len(sends), file)
+            os.unlink(file)
+            f.close()
+
+    # doubtful
+    def doubtful(self):
+
+        # sends that may or may not have been authorized, in number order
+        self.adopt()
+        limit = time.time() - self.settle
+        with self._lock:
+            entries = [self._open[id] for id in self._doubt if self._open[id]["at"] <= limit]
+        return sorted(entries, key=lambda e: (e["ptoVta"], e["cbteTipo"], e["cbteDesde"]))
+
+    # compact
+    def compact(self):
+
+        # called under the lock: a new file with only the open sends
+        f = self.create(self.file + ".compact")
+        f.write("".join(json.dumps(r) + "\n" for r in self._open.values()))
+        f.flush()
+        os.fsync(f.fileno())
+        os.replace(self.file + ".compact", self.file)
+        self._f.close()
+        self._f = f
+
+    # close
+    def close(self):
+
+        # nothing left in doubt, nothing to keep
+        with self._lock:
+            if not self._open:
+                os.unlink(self.file)
+            self._f.close()
+
+
+    # __enter__
+    def __enter__(self):
+        return self
+
+    # __exit__
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,91 @@
+import threading
+
+from Logger import *
+from Resilience import *
+
+
+# CaeaDrainer
+class CaeaDrainer:
+
+    # __init__
+    def __init__(self, client, journal, interval=30, maxInterval=600):
+        self.client = client
+        self.journal = journal
+        self.interval = interval
+        self.maxInterval = maxInterval
+        self.logger = Logger()
+        # the last failure of the background loop, None after a good drain
+        self.error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    # start
+    def start(self):
+        self._thread = threading.Thread(target=self.loop, name="CaeaDrainer", daemon=True)
+        self._thread.start()
+
+    # stop
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    # loop
+    def loop(self):
+
+        wait = self.interval
+        while not self._stop.is_set():
+            try:
+                self.drain()
+                self.error = None
+                wait = self.interval
+            except Exception as e:
+                # AFIP unreachable or refusing, back off until the next attempt
+                self.logger.warning("CAEA drain failed: %s", e)
+                self.error = e
+                wait = min(wait * 2, self.maxInterval)
+            self._stop.wait(wait)
+
+    # drain
+    def drain(self):
+
+        size = self.client.fECompTotXRequest()
+        for (ptoVta, cbteTipo), entries in self.journal.pending().items():
+            for start in range(0, len(entries), size):
+                self.submit(ptoVta, cbteTipo, entries[start : start + size])
+
+    # submit
+    def submit(self, ptoVta, cbteTipo, entries):
+
+        details = []
+        for entry in entries:
+            detail = dict(entry["receipt"])
+            detail["CbteDesde"] = entry["cbteNro"]
+            detail["CbteHasta"] = entry["cbteNro"]
+            detail["CAEA"] = entry["caea"]
+            details.append(detail)
+
+        response = self.client.fECAEARegInformativo(ptoVta, cbteTipo, details)
+
+        # Errors without details refuse the whole request: nothing was
+        # informed, the entries stay pending and the drain fails
+        answered = self.client.feDetResp(response, "FECAEADetResponse")
+        if not answered:
+            errors = getattr(getattr(response, "Errors", None), "Err", None) or []
+            self.logger.error(
+                "CAEA %d-%d refused: %s",
+                ptoVta,
+                cbteTipo,
+                "; ".join("%s %s" % (e.Code, e.Msg) for e in errors) or "no details",
+            )
+            raise AfipError(errors[0].Code if errors else 0, response)
+
+        # rejected receipts are recorded too, they need manual attention
+        # and resending them unchanged would fail the same way; the journal
+        # keeps them until acknowledged
+        results = []
+        for detail in answered:
+            results.append((ptoVta, cbteTipo, detail.CbteDesde, detail.Resultado))
+            if detail.Resultado != "A":
+                self.logger.warning("CAEA receipt %d rejected", detail.CbteDesde)
+        self.journal.markDone(results)
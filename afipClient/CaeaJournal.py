@@ -0,0 +1,181 @@
+import json
+import os
+import threading
+
+from Logger import *
+
+
+# CaeaJournal
+class CaeaJournal:
+
+    # __init__
+    def __init__(self, type, dir="cache/caea"):
+
+        self.dir = os.path.join(dir, type)
+        self.file = os.path.join(self.dir, "journal.jsonl")
+        self.logger = Logger()
+        self._entries = {}
+        self._pending = set()
+        # informed and rejected, kept until someone acknowledges them
+        self._rejected = set()
+        self._lock = threading.Lock()
+
+        os.makedirs(self.dir, exist_ok=True)
+        self.load()
+        self._f = open(self.file, "a")
+
+    # key
+    def key(self, ptoVta, cbteTipo, cbteNro):
+        return (int(ptoVta), int(cbteTipo), int(cbteNro))
+
+    # load
+    def load(self):
+
+        if not os.path.exists(self.file):
+            return
+
+        f = open(self.file, "rb+")
+        data = f.read()
+
+        # drop a record torn by a crash, everything before it is intact
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            self.logger.warning("Dropping incomplete journal record")
+            f.truncate(end)
+        f.close()
+
+        for line in data[:end].splitlines():
+            self.apply(json.loads(line))
+
+    # apply
+    def apply(self, record):
+
+        key = self.key(record["ptoVta"], record["cbteTipo"], record["cbteNro"])
+        if record["op"] == "issue":
+            # a corrected receipt informed again replaces the rejected one
+            self._entries[key] = record
+            self._pending.add(key)
+            self._rejected.discard(key)
+        elif record["op"] == "done":
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry["resultado"] = record["resultado"]
+                if record["resultado"] == "R":
+                    self._rejected.add(key)
+            self._pending.discard(key)
+        elif record["op"] == "ack":
+            self._rejected.discard(key)
+
+    # write
+    def write(self, records):
+
+        # one fsync per call, the record is durable before we return
+        data = "".join(json.dumps(r, default=str) + "\n" for r in records)
+        self._f.write(data)
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    # append
+    def append(self, ptoVta, cbteTipo, cbteNro, caea, receipt):
+
+        record = {
+            "op": "issue",
+            "ptoVta": ptoVta,
+            "cbteTipo": cbteTipo,
+            "cbteNro": cbteNro,
+            "caea": caea,
+            "receipt": receipt,
+        }
+        with self._lock:
+            self.write([record])
+            self.apply(record)
+
+    # markDone
+    def markDone(self, results):
+
+        # results: (ptoVta, cbteTipo, cbteNro, resultado)
+        records = [
+            {"op": "done", "ptoVta": p, "cbteTipo": t, "cbteNro": n, "resultado": r}
+            for p, t, n, r in results
+        ]
+        with self._lock:
+            self.write(records)
+            for record in records:
+                self.apply(record)
+
+    # acknowledge
+    def acknowledge(self, keys):
+
+        # keys: (ptoVta, cbteTipo, cbteNro) of rejected receipts dealt with
+        with self._lock:
+            records = [
+                {"op": "ack", "ptoVta": p, "cbteTipo": t, "cbteNro": n}
+                for p, t, n in keys
+                if self.key(p, t, n) in self._rejected
+            ]
+            if records:
+                self.write(records)
+            for record in records:
+                self.apply(record)
+        return len(records)
+
+    # rejected
+    def rejected(self):
+
+        # rejected entries not yet acknowledged, in number order
+        with self._lock:
+            return [self._entries[key] for key in sorted(self._rejected)]
+
+    # get
+    def get(self, ptoVta, cbteTipo, cbteNro):
+        return self._entries.get(self.key(ptoVta, cbteTipo, cbteNro))
+
+    # pending
+    def pending(self):
+
+        # pending entries grouped by (PtoVta, CbteTipo), in number order
+        with self._lock:
+            keys = sorted(self._pending)
+            groups = {}
+            for key in keys:
+                groups.setdefault(key[:2], []).append(self._entries[key])
+        return groups
+
+    # compact
+    def compact(self):
+
+        # rewrite the journal with only the receipts still to be informed
+        # and the rejected ones nobody acknowledged yet
+        with self._lock:
+            keep = self._pending | self._rejected
+            tmp = self.file + ".tmp"
+            f = open(tmp, "w")
+            for key in sorted(keep):
+                entry = dict(self._entries[key], op="issue")
+                resultado = entry.pop("resultado", None)
+                f.write(json.dumps(entry, default=str) + "\n")
+                if key in self._rejected:
+                    done = {"op": "done", "resultado": resultado}
+                    done.update(zip(("ptoVta", "cbteTipo", "cbteNro"), key))
+                    f.write(json.dumps(done) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+            f.close()
+
+            self._f.close()
+            os.replace(tmp, self.file)
+            self._f = open(self.file, "a")
+            self._entries = {key: self._entries[key] for key in keep}
+
+    # close
+    def close(self):
+        self._f.close()
+
+
+    # __enter__
+    def __enter__(self):
+        return self
+
+    # __exit__
+    def __exit__(self, *exc):
+        self.close()
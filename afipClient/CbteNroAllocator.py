@@ -0,0 +1,161 @@
+import fcntl
+import os
+import threading
+
+# numbering errors reported by AFIP
+NUMBERING_ERRORS = (10016,)
+
+
+# Hold
+class Hold:
+
+    # exclusive use of one point of sale and receipt type by a thread lock
+    # and a file lock, acquire and release may run on different threads
+    def __init__(self, lock, path):
+        self.lock = lock
+        self.path = path
+        self.fd = None
+
+    # acquire
+    def acquire(self):
+        self.lock.acquire()
+        try:
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        except BaseException:
+            if self.fd is not None:
+                os.close(self.fd)
+                self.fd = None
+            self.lock.release()
+            raise
+
+    # release
+    def release(self):
+        try:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+        finally:
+            self.fd = None
+            self.lock.release()
+
+    # __enter__
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    # __exit__
+    def __exit__(self, *exc):
+        self.release()
+
+
+# CbteNroAllocator
+class CbteNroAllocator:
+
+    # __init__
+    def __init__(self, type, seed, dir="cache/numbers"):
+
+        # seed(ptoVta, cbteTipo) returns the last authorized number
+        self.seed = seed
+        self.dir = os.path.join(dir, type)
+        self._locks = {}
+        self._holds = {}
+        self._lock = threading.Lock()
+
+    # path
+    def path(self, ptoVta, cbteTipo):
+        return os.path.join(self.dir, "%d-%d" % (ptoVta, cbteTipo))
+
+    # threadLock
+    def threadLock(self, ptoVta, cbteTipo):
+        with self._lock:
+            lock = self._locks.get((ptoVta, cbteTipo))
+            if lock is None:
+                lock = self._locks[(ptoVta, cbteTipo)] = threading.Lock()
+        return lock
+
+    # hold
+    def hold(self, ptoVta, cbteTipo):
+
+        # one batch per key in flight, held from allocate through settling:
+        # AFIP rejects with 10016 any number sent while a lower one is still
+        # unanswered, so a second batch allocated past ours would fail. The
+        # lock file is not the number file, flock on two descriptors of one
+        # file conflicts even within a process
+        os.makedirs(self.dir, exist_ok=True)
+        with self._lock:
+            lock = self._holds.get((ptoVta, cbteTipo))
+            if lock is None:
+                lock = self._holds[(ptoVta, cbteTipo)] = threading.Lock()
+        return Hold(lock, self.path(ptoVta, cbteTipo) + ".lock")
+
+    # update
+    def update(self, ptoVta, cbteTipo, fn):
+
+        # fn(last) returns (newLast, result), applied under a thread lock and
+        # an exclusive file lock so workers of other processes see it too
+        os.makedirs(self.dir, exist_ok=True)
+        with self.threadLock(ptoVta, cbteTipo):
+            fd = os.open(self.path(ptoVta, cbteTipo), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                data = os.read(fd, 32).strip()
+                last = int(data) if data else None
+                newLast, result = fn(last)
+                if newLast != last:
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    os.ftruncate(fd, 0)
+                    os.write(fd, b"%d" % newLast)
+                    os.fsync(fd)
+                return result
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+    # allocate
+    def allocate(self, ptoVta, cbteTipo, count=1):
+
+        # returns the first of count consecutive numbers, seeding is a round
+        # trip and is made outside the file lock
+        while True:
+            seed = None
+            if self.read(ptoVta, cbteTipo) is None:
+                seed = self.seed(ptoVta, cbteTipo)
+
+            def fn(last):
+                if last is None:
+                    if seed is None:
+                        return None, None
+                    last = seed
+                return last + count, last + 1
+
+            first = self.update(ptoVta, cbteTipo, fn)
+            if first is not None:
+                return first
+
+    # read
+    def read(self, ptoVta, cbteTipo):
+        return self.update(ptoVta, cbteTipo, lambda last: (last, last))
+
+    # release
+    def release(self, ptoVta, cbteTipo, end, used):
+
+        # hand back end..used+1 when nobody allocated after us
+        def fn(last):
+            if last == end:
+                return used, None
+            return last, None
+
+        self.update(ptoVta, cbteTipo, fn)
+
+    # resync
+    def resync(self, ptoVta, cbteTipo):
+        last = self.seed(ptoVta, cbteTipo)
+        return self.update(ptoVta, cbteTipo, lambda previous: (last, last))
+
+    # isNumberingError
+    def isNumberingError(self, detail):
+        obs = detail.Observaciones
+        for o in (obs and obs.Obs) or []:
+            if o.Code in NUMBERING_ERRORS:
+                return True
+        return False
@@ -0,0 +1,51 @@
+import base64
+import threading
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.serialization import pkcs7
+
+
+# CmsSigner
+class CmsSigner:
+
+    # __init__
+    def __init__(self, certificate="curl/MiCertificado.pem", privateKey="curl/MiClavePrivada.key"):
+        self.certificate = certificate
+        self.privateKey = privateKey
+        self._cert = None
+        self._key = None
+        self._lock = threading.Lock()
+
+    # load
+    def load(self):
+
+        with self._lock:
+            if self._cert is not None:
+                return
+
+            f = open(self.certificate, "rb")
+            cert = x509.load_pem_x509_certificate(f.read())
+            f.close()
+
+            f = open(self.privateKey, "rb")
+            key = serialization.load_pem_private_key(f.read(), password=None)
+            f.close()
+
+            self._key = key
+            self._cert = cert
+
+    # sign
+    def sign(self, data):
+
+        # same output as openssl cms -sign -nodetach, base64 without PEM armor
+        if self._cert is None:
+            self.load()
+
+        cms = (
+            pkcs7.PKCS7SignatureBuilder()
+            .set_data(data)
+            .add_signer(self._cert, self._key, hashes.SHA256())
+            .sign(serialization.Encoding.DER, [])
+        )
+        return base64.b64encode(cms).decode("ascii")
@@ -12,10 +12,7 @@ class FECAEAConsultar(Wsfe):
 		super().__init__()
 		
 	# run
-	def run(self):
+	def run(self, periodo='202109', orden=1):
 	
-		periodo = '202109'
-		orden = 1
-		 
-		print(self._client.service.FECAEAConsultar(Auth=self._auth, Periodo=periodo, Orden=orden))
+		return self._client.service.FECAEAConsultar(Auth=self._auth, Periodo=periodo, Orden=orden)
 
@@ -0,0 +1,28 @@
+from zeep import Client
+from Wsfe import *
+
+
+# FECAEARegInformativo
+class FECAEARegInformativo(Wsfe):
+
+    # __init__
+    def __init__(self):
+        super().__init__()
+
+    # run
+    def run(self, ptoVta, cbteTipo, details):
+
+        feCAEARegInfReq = {
+            "FeCabReq": {
+                "CantReg": len(details),
+                "PtoVta": ptoVta,
+                "CbteTipo": cbteTipo,
+            },
+            "FeDetReq": {"FECAEADetRequest": details},
+        }
+
+        self.logger.info("Running FECAEARegInformativo batch of %d", len(details))
+        response = self._client.service.FECAEARegInformativo(
+            Auth=self._auth, FeCAEARegInfReq=feCAEARegInfReq
+        )
+        return response
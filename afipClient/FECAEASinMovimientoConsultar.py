@@ -17,5 +17,5 @@ class FECAEASinMovimientoConsultar(Wsfe):
 		ptoVta = 1
 		cAEA = '31376603902443'
 		 
-		print(self._client.service.FECAEASinMovimientoConsultar(Auth=self._auth, PtoVta=ptoVta, CAEA=cAEA))
+		return self._client.service.FECAEASinMovimientoConsultar(Auth=self._auth, PtoVta=ptoVta, CAEA=cAEA)
 
@@ -17,5 +17,5 @@ class FECAEASinMovimientoInformar(Wsfe):
 		ptoVta = 1
 		cAEA = '31376603902443'
 		 
-		print(self._client.service.FECAEASinMovimientoInformar(Auth=self._auth, PtoVta=ptoVta, CAEA=cAEA))
+		return self._client.service.FECAEASinMovimientoInformar(Auth=self._auth, PtoVta=ptoVta, CAEA=cAEA)
 
@@ -50,7 +50,30 @@ class FECAESolicitar(Wsfe):
 			}
 		}
 				 
-		print(self._client.service.FECAESolicitar(Auth=self._auth, FeCAEReq=feCAEReq))
+		return self._client.service.FECAESolicitar(Auth=self._auth, FeCAEReq=feCAEReq)
 
+	# runBatch
+	def runBatch(self, ptoVta, cbteTipo, receipts, cbteDesde):
 
+		# one number per receipt, consecutive from cbteDesde
+		details = []
+		for i, receipt in enumerate(receipts):
+			detail = dict(receipt)
+			detail['CbteDesde'] = cbteDesde + i
+			detail['CbteHasta'] = cbteDesde + i
+			details.append(detail)
 
+		feCAEReq = {
+			'FeCabReq': {
+				'CantReg': len(details),
+				'PtoVta': ptoVta,
+				'CbteTipo': cbteTipo,
+			},
+			'FeDetReq': {
+				'FECAEDetRequest': details
+			}
+		}
+
+		self.logger.info('Running FECAESolicitar batch of %d', len(details))
+		response = self._client.service.FECAESolicitar(Auth=self._auth, FeCAEReq=feCAEReq)
+		return response
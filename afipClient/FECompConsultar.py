@@ -9,12 +9,12 @@ class FECompConsultar(Wsfe):
 		super().__init__()
 		
 	# run
-	def run(self):	
+	def run(self, ptoVta=1, cbteTipo=1, cbteNro=1):
 		
 		feCompConsReq = {	
-		   'CbteTipo': 1, 			
-		   'CbteNro': 1, 
-		   'PtoVta': 1
+		   'CbteTipo': cbteTipo, 			
+		   'CbteNro': cbteNro, 
+		   'PtoVta': ptoVta
 		}
 		
 		self.logger.info('Running FECompConsultar')
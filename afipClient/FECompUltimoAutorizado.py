@@ -9,10 +9,7 @@ class FECompUltimoAutorizado(Wsfe):
 		super().__init__()
 		
 	# run
-	def run(self):	
-		
-		ptoVta = 1
-		cbteTipo = 1
+	def run(self, ptoVta=1, cbteTipo=1):
 
 		self.logger.info('Running FECompUltimoAutorizado')
 		response = self._client.service.FECompUltimoAutorizado(Auth=self._auth, PtoVta=ptoVta, CbteTipo=cbteTipo)
@@ -12,7 +12,7 @@ class FEDummy(Wsfe):
 	# run
 	def run(self):
 			 
-		print(self._client.service.FEDummy())
+		return self._client.service.FEDummy()
 
 
 
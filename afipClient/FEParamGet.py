@@ -11,7 +11,7 @@ class FEParamGet(Wsfe):
 	# run
 	def run(self, param):
 
-		self.logger.info('Running ' + param)
+		self.logger.info('Running %s', param)
 		method_to_call = getattr(self._client.service, param)
 		response = method_to_call(Auth=self._auth)
 		return response
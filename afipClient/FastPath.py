@@ -0,0 +1,350 @@
+from types import SimpleNamespace
+from xml.sax.saxutils import escape
+
+from lxml import etree
+from zeep.exceptions import XMLParseError
+from Metrics import recordTransfer
+
+FEV1 = "http://ar.gov.afip.dif.FEV1/"
+
+ENVELOPE_HEAD = (
+    b'<?xml version="1.0" encoding="utf-8"?>'
+    b'<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">'
+    b"<soap:Body>"
+)
+ENVELOPE_TAIL = b"</soap:Body></soap:Envelope>"
+
+# deepest element path walked in the wsdl, the request types are shallow
+MAX_DEPTH = 8
+
+# rendered once at start and parsed back by zeep, the templates are only
+# used when the loaded wsdl reads them as sent
+SAMPLE_AUTH = {"Token": "T", "Sign": "S", "Cuit": 20111111112}
+SAMPLE_DETAIL = {
+    "Concepto": 1, "DocTipo": 80, "DocNro": 20111111112, "CbteDesde": 1, "CbteHasta": 1,
+    "CbteFch": "20210928", "ImpTotal": 121, "ImpTotConc": 0, "ImpNeto": 100, "ImpOpEx": 0,
+    "ImpTrib": 0, "ImpIVA": 21, "MonId": "PES", "MonCotiz": 1,
+    "Iva": [{"AlicIva": {"Id": 5, "BaseImp": 100, "Importe": 21}}],
+}
+
+# response elements are matched by local name, the mock and AFIP differ
+# in how they qualify them
+_feCabResp = etree.XPath("//*[local-name()='FeCabResp']")
+_feDetResp = etree.XPath(
+    "//*[local-name()='FECAEDetResponse']"
+    " | //*[local-name()='FeDetResp'][not(*[local-name()='FECAEDetResponse'])]"
+)
+_obs = etree.XPath("*[local-name()='Observaciones']/*[local-name()='Obs']")
+_errors = etree.XPath("//*[local-name()='Errors']/*[local-name()='Err']")
+_lastCbte = etree.XPath("//*[local-name()='FECompUltimoAutorizadoResult' or local-name()='FECompUltimoAutorizadoResponse']")
+_fault = etree.XPath("//*[local-name()='Fault']/faultstring/text()")
+
+
+# Template
+class Template:
+
+    # an operation's request element as the loaded wsdl declares it: the
+    # prefixed name of every element by its path of local names, and the
+    # children of each in schema order
+    def __init__(self, client, operation):
+        self.operation = operation
+        self.body = client.service._binding.get(operation).input.body
+        self.schema = client.wsdl.types
+        self.prefixes = {}
+        self.names = {}
+        self.children = {}
+        self.walk(self.body, (operation,))
+        self.declarations = "".join(
+            ' xmlns:%s="%s"' % (prefix, namespace) for namespace, prefix in self.prefixes.items()
+        )
+
+    # walk
+    def walk(self, element, path):
+
+        # the mock and AFIP qualify nested elements differently, each
+        # element is rendered in the namespace its own schema gives it
+        namespace = element.qname.namespace
+        if namespace:
+            prefix = self.prefixes.setdefault(namespace, "n%d" % len(self.prefixes))
+            self.names[path] = prefix + ":" + element.qname.localname
+        else:
+            self.names[path] = element.qname.localname
+
+        children = [child for name, child in getattr(element.type, "elements", [])]
+        self.children[path] = tuple(child.qname.localname for child in children)
+        if len(path) < MAX_DEPTH:
+            for child in children:
+                self.walk(child, path + (child.qname.localname,))
+
+    # name
+    def name(self, *path):
+        if path not in self.names:
+            raise ValueError("%s is not in the %s request" % ("/".join(path), self.operation))
+        return self.names[path]
+
+    # root
+    def root(self):
+        name = self.names[(self.operation,)]
+        return ("<%s%s>" % (name, self.declarations)).encode(), ("</%s>" % name).encode()
+
+    # auth
+    def auth(self):
+        path = (self.operation, "Auth")
+        return (
+            "<{0}><{1}>%s</{1}><{2}>%s</{2}><{3}>%s</{3}></{0}>".format(
+                self.name(*path),
+                self.name(*path, "Token"),
+                self.name(*path, "Sign"),
+                self.name(*path, "Cuit"),
+            )
+        )
+
+    # parse
+    def parse(self, body):
+        return self.body.parse(etree.fromstring(body), self.schema)
+
+
+# FastPath
+class FastPath:
+
+    # __init__
+    def __init__(self, client, transport):
+        self._session = transport.session
+        self._timeout = transport.operation_timeout
+        self._address = client.service._binding_options["address"]
+        self._auth = {}
+        self.compileFECAESolicitar(Template(client, "FECAESolicitar"))
+        self.compileFECompUltimoAutorizado(Template(client, "FECompUltimoAutorizado"))
+        self.check()
+
+    # compileFECAESolicitar
+    def compileFECAESolicitar(self, template):
+
+        request = ("FECAESolicitar", "FeCAEReq")
+        cab = request + ("FeCabReq",)
+        det = request + ("FeDetReq",)
+        self._solicitar = template
+        self._solicitarRoot = template.root()
+        self._solicitarAuth = template.auth()
+        self._solicitarHead = (
+            "<{0}><{1}><{2}>%d</{2}><{3}>%d</{3}><{4}>%d</{4}></{1}><{5}>".format(
+                template.name(*request),
+                template.name(*cab),
+                template.name(*cab, "CantReg"),
+                template.name(*cab, "PtoVta"),
+                template.name(*cab, "CbteTipo"),
+                template.name(*det),
+            )
+        )
+        self._solicitarTail = "</%s></%s>" % (template.name(*det), template.name(*request))
+
+        # FECAEDetRequest, its fields and arrays, in schema order
+        if len(template.children[det]) != 1:
+            raise ValueError("FeDetReq does not hold a single repeated detail")
+        detail = det + template.children[det]
+        self._detail = template.name(*detail)
+        self._fields = []
+        for field in template.children[detail]:
+            path = detail + (field,)
+            array = None
+            if template.children[path]:
+                item = path + template.children[path][:1]
+                array = (
+                    item[-1],
+                    template.name(*item),
+                    tuple((name, template.name(*item, name)) for name in template.children[item]),
+                )
+            self._fields.append((field, template.name(*path), array))
+        self._known = frozenset(field for field, name, array in self._fields)
+
+    # compileFECompUltimoAutorizado
+    def compileFECompUltimoAutorizado(self, template):
+
+        root = ("FECompUltimoAutorizado",)
+        self._ultimo = template
+        self._ultimoRoot = template.root()
+        self._ultimoAuth = template.auth()
+        self._ultimoBody = "<{0}>%d</{0}><{1}>%d</{1}>".format(
+            template.name(*root, "PtoVta"),
+            template.name(*root, "CbteTipo"),
+        ).encode()
+
+    # check
+    def check(self):
+
+        # zeep reads the sample back, strict about unexpected elements
+        try:
+            request = self._solicitar.parse(self.renderFECAESolicitar(SAMPLE_AUTH, 1, 1, [SAMPLE_DETAIL]))
+            solicitar = request.Auth.Token == "T" and request.FeCAEReq.FeCabReq.CantReg == 1
+            request = self._ultimo.parse(self.renderFECompUltimoAutorizado(SAMPLE_AUTH, 7, 1))
+            ultimo = request.Auth.Token == "T" and request.PtoVta == 7
+        except XMLParseError as e:
+            raise ValueError("Fast path templates do not match the wsdl: %s" % e)
+        if not (solicitar and ultimo):
+            raise ValueError("Fast path templates do not match the wsdl")
+
+    # auth
+    def auth(self, template, auth):
+
+        # rendered once per ticket
+        key = (template, auth["Token"], auth["Sign"], auth["Cuit"])
+        if key[0] not in self._auth or self._auth[key[0]][0] != key:
+            xml = template % tuple(escape(str(v)) for v in key[1:])
+            self._auth[key[0]] = (key, xml.encode("utf-8"))
+        return self._auth[key[0]][1]
+
+    # post
+    def post(self, operation, body):
+
+        headers = {
+            "Content-Type": "text/xml; charset=utf-8",
+            "SOAPAction": '"' + FEV1 + operation + '"',
+        }
+        data = ENVELOPE_HEAD + body + ENVELOPE_TAIL
+        response = self._session.post(
+            self._address,
+            data=data,
+            headers=headers,
+            timeout=self._timeout,
+        )
+        recordTransfer(len(data), len(response.content))
+        doc = etree.fromstring(response.content)
+        fault = _fault(doc)
+        if fault:
+            raise Exception(fault[0])
+        return doc
+
+    # renderValue
+    def renderValue(self, name, value):
+        return "<%s>%s</%s>" % (name, escape(str(value)), name)
+
+    # renderArray
+    def renderArray(self, name, array, value):
+
+        # accepts [{'AlicIva': {...}}], {'AlicIva': [...]} or [{...}]
+        itemName, itemTag, fields = array
+        items = value.get(itemName, []) if isinstance(value, dict) else value
+        if isinstance(items, dict):
+            items = [items]
+
+        parts = ["<" + name + ">"]
+        for item in items:
+            item = item.get(itemName, item)
+            parts.append("<" + itemTag + ">")
+            for field, tag in fields:
+                if item.get(field) is not None:
+                    parts.append(self.renderValue(tag, item[field]))
+            parts.append("</" + itemTag + ">")
+        parts.append("</" + name + ">")
+        return "".join(parts)
+
+    # renderDetail
+    def renderDetail(self, detail):
+
+        # zeep refuses fields the wsdl lacks, so does the fast path
+        unknown = detail.keys() - self._known
+        if unknown:
+            raise TypeError("%s got unexpected fields: %s" % (self._detail, ", ".join(sorted(unknown))))
+
+        parts = ["<" + self._detail + ">"]
+        for field, name, array in self._fields:
+            value = detail.get(field)
+            if value is None:
+                continue
+            if array is not None:
+                parts.append(self.renderArray(name, array, value))
+            else:
+                parts.append(self.renderValue(name, value))
+        parts.append("</" + self._detail + ">")
+        return "".join(parts)
+
+    # renderFECAESolicitar
+    def renderFECAESolicitar(self, auth, ptoVta, cbteTipo, details):
+
+        head = self._solicitarHead % (len(details), ptoVta, cbteTipo)
+        body = head + "".join(self.renderDetail(d) for d in details) + self._solicitarTail
+        start, end = self._solicitarRoot
+        return start + self.auth(self._solicitarAuth, auth) + body.encode("utf-8") + end
+
+    # fields
+    def fields(self, element):
+        return {child.tag.rpartition("}")[2]: child.text for child in element}
+
+    # text
+    def text(self, element, name):
+        return self.fields(element).get(name)
+
+    # parseErrors
+    def parseErrors(self, doc):
+        errors = [
+            SimpleNamespace(Code=int(self.text(e, "Code")), Msg=self.text(e, "Msg"))
+            for e in _errors(doc)
+        ]
+        return SimpleNamespace(Err=errors) if errors else None
+
+    # parseFECAESolicitar
+    def parseFECAESolicitar(self, doc):
+
+        cab = None
+        for element in _feCabResp(doc):
+            cab = SimpleNamespace(Resultado=self.text(element, "Resultado"))
+
+        details = []
+        for element in _feDetResp(doc):
+            fields = self.fields(element)
+            obs = [
+                SimpleNamespace(Code=int(self.text(o, "Code")), Msg=self.text(o, "Msg"))
+                for o in _obs(element)
+            ]
+            details.append(
+                SimpleNamespace(
+                    CbteDesde=int(fields["CbteDesde"]),
+                    CbteHasta=int(fields["CbteHasta"]),
+                    Resultado=fields.get("Resultado"),
+                    CAE=fields.get("CAE"),
+                    CAEFchVto=fields.get("CAEFchVto"),
+                    Observaciones=SimpleNamespace(Obs=obs) if obs else None,
+                )
+            )
+
+        return SimpleNamespace(
+            FeCabResp=cab,
+            FeDetResp=SimpleNamespace(FECAEDetResponse=details) if details else None,
+            Errors=self.parseErrors(doc),
+        )
+
+    # fECAESolicitar
+    def fECAESolicitar(self, auth, ptoVta, cbteTipo, receipts, cbteDesde):
+
+        details = []
+        for i, receipt in enumerate(receipts):
+            detail = dict(receipt)
+            detail["CbteDesde"] = cbteDesde + i
+            detail["CbteHasta"] = cbteDesde + i
+            details.append(detail)
+
+        body = self.renderFECAESolicitar(auth, ptoVta, cbteTipo, details)
+        return self.parseFECAESolicitar(self.post("FECAESolicitar", body))
+
+    # renderFECompUltimoAutorizado
+    def renderFECompUltimoAutorizado(self, auth, ptoVta, cbteTipo):
+        start, end = self._ultimoRoot
+        return start + self.auth(self._ultimoAuth, auth) + self._ultimoBody % (ptoVta, cbteTipo) + end
+
+    # parseFECompUltimoAutorizado
+    def parseFECompUltimoAutorizado(self, doc):
+
+        result = _lastCbte(doc)
+        fields = self.fields(result[-1] if result else doc)
+        cbteNro = fields.get("CbteNro")
+        return SimpleNamespace(
+            PtoVta=int(fields.get("PtoVta") or 0),
+            CbteTipo=int(fields.get("CbteTipo") or 0),
+            CbteNro=int(cbteNro) if cbteNro is not None else None,
+            Errors=self.parseErrors(doc),
+        )
+
+    # fECompUltimoAutorizado
+    def fECompUltimoAutorizado(self, auth, ptoVta, cbteTipo):
+        body = self.renderFECompUltimoAutorizado(auth, ptoVta, cbteTipo)
+        return self.parseFECompUltimoAutorizado(self.post("FECompUltimoAutorizado", body))
@@ -0,0 +1,58 @@
+import requests
+from requests.adapters import HTTPAdapter
+from zeep import Transport
+from Metrics import recordTransfer
+
+
+# HttpTransport
+class HttpTransport(Transport):
+
+    # __init__
+    def __init__(
+        self,
+        cache=None,
+        poolConnections=4,
+        poolMaxsize=10,
+        connectTimeout=5,
+        readTimeout=60,
+    ):
+
+        # keep-alive pool, poolMaxsize connections per host
+        session = requests.Session()
+        self.adapter = HTTPAdapter(
+            pool_connections=poolConnections, pool_maxsize=poolMaxsize, pool_block=True
+        )
+        session.mount("https://", self.adapter)
+        session.mount("http://", self.adapter)
+
+        timeout = (connectTimeout, readTimeout)
+        super().__init__(cache=cache, timeout=timeout, operation_timeout=timeout, session=session)
+
+    # post
+    def post(self, address, message, headers):
+        response = super().post(address, message, headers)
+        recordTransfer(len(message), len(response.content))
+        return response
+
+    # warmUp
+    def warmUp(self, urls):
+
+        # open one connection per host so the first operation skips the handshake
+        for url in dict.fromkeys(urls):
+            try:
+                self.session.head(url, timeout=self.load_timeout).close()
+            except requests.RequestException as e:
+                self.logger.warning("Warm up of %s failed: %s", url, e)
+
+    # stats
+    def stats(self):
+
+        opened = 0
+        sent = 0
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            opened += pool.num_connections
+            sent += pool.num_requests
+
+        return {"opened": opened, "reused": sent - opened, "requests": sent}
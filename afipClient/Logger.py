@@ -1,11 +1,145 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARNING = logging.WARNING
+ERROR = logging.ERROR
+
+LOGGER_NAME = "afipClient"
+
+# longest message written, responses can be huge
+MAX_PAYLOAD = 2000
+
+_listener = None
+_lock = threading.Lock()
+
+
+# PayloadFormatter
+class PayloadFormatter(logging.Formatter):
+
+	# __init__
+	def __init__(self, fmt=None, maxPayload=MAX_PAYLOAD):
+		super().__init__(fmt)
+		self.maxPayload = maxPayload
+
+	# message
+	def message(self, record):
+
+		message = record.getMessage()
+		if self.maxPayload and len(message) > self.maxPayload:
+			extra = len(message) - self.maxPayload
+			message = message[:self.maxPayload] + " ... (%d more chars)" % extra
+		return message
+
+	# format
+	def format(self, record):
+		record.message = self.message(record)
+		text = self._fmt % record.__dict__
+		if record.exc_info:
+			text += "\n" + self.formatException(record.exc_info)
+		return text
+
+
+# JsonFormatter
+class JsonFormatter(PayloadFormatter):
+
+	# format
+	def format(self, record):
+
+		entry = {
+			"time": record.created,
+			"level": record.levelname,
+			"logger": record.name,
+			"thread": record.threadName,
+			"message": self.message(record),
+		}
+		if record.exc_info:
+			entry["exception"] = self.formatException(record.exc_info)
+		return json.dumps(entry, default=str)
+
+
+# DeferredQueueHandler
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+
+	# prepare
+	def prepare(self, record):
+		# leave formatting (and str() of the arguments) to the writer thread
+		return record
+
+
+# configure
+def configure(level=INFO, asJson=False, maxPayload=MAX_PAYLOAD, stream=None):
+
+	global _listener
+
+	if asJson:
+		formatter = JsonFormatter(maxPayload=maxPayload)
+	else:
+		formatter = PayloadFormatter(">>>> %(message)s...", maxPayload)
+
+	handler = logging.StreamHandler(stream or sys.stdout)
+	handler.setFormatter(formatter)
+
+	with _lock:
+		if _listener is not None:
+			_listener.stop()
+
+		q = queue.SimpleQueue()
+		logger = logging.getLogger(LOGGER_NAME)
+		logger.handlers = [DeferredQueueHandler(q)]
+		logger.setLevel(level)
+		logger.propagate = False
+
+		_listener = logging.handlers.QueueListener(q, handler)
+		_listener.start()
+
+
+# shutdown
+def shutdown():
+
+	# flush what is still queued
+	global _listener
+	with _lock:
+		if _listener is not None:
+			_listener.stop()
+			_listener = None
+
+
+atexit.register(shutdown)
+
+
 # Logger
 class Logger:
 
 	# __init__
-	def __init__(self):
-		a = None
-		
-	# buildRequest
-	def info(self, message):
-		
-		print (">>>> " + str(message) + "...")
\ No newline at end of file
+	def __init__(self, name=LOGGER_NAME):
+
+		if _listener is None:
+			configure()
+		self.logger = logging.getLogger(name)
+
+	# isEnabled
+	def isEnabled(self, level):
+		return self.logger.isEnabledFor(level)
+
+	# debug
+	def debug(self, message, *args):
+		self.logger.debug(message, *args)
+
+	# info
+	def info(self, message, *args):
+		self.logger.info(message, *args)
+
+	# warning
+	def warning(self, message, *args):
+		self.logger.warning(message, *args)
+
+	# error
+	def error(self, message, *args):
+		self.logger.error(message, *args)
@@ -5,19 +5,36 @@ from datetime import timedelta
 import uuid
 import itertools
 from subprocess import call
+import os
 import re
+import threading
+from collections import namedtuple
 from Logger import *
+from CmsSigner import *
+from Metrics import *
+
+# Ticket
+# one access ticket, replaced as a whole so token and sign always match
+Ticket = namedtuple('Ticket', ['token', 'sign', 'cuit', 'expiration'])
 
 # LoginCms
 class LoginCms:
 
 	# __init__
-	def __init__(self):
+	def __init__(self, cuit=None, service='wsfe', taFile="TA.xml", signer=None, proactive=True):
 		self.client = None	
-		self.token = None
-		self.sign = None
-		self.cuit = None
+		self.ticket = None
+		self.cuit = cuit
+		self.service = service
+		self.taFile = taFile
+		self.refreshMargin = timedelta(minutes=10)
+		self.signer = signer or CmsSigner()
+		# without it the ticket is renewed on first use after expiry
+		self.proactive = proactive
+		self.metrics = Metrics()
 		self.logger = Logger()
+		self._lock = threading.Lock()
+		self._timer = None
 		
 	# buildRequest
 	def buildRequest(self):
@@ -44,12 +61,16 @@ class LoginCms:
 		root.append(header)
 		
 		service = etree.Element('service')
-		service.text = 'wsfe'
+		service.text = self.service
 		root.append(service)
 		
 		s = etree.tostring(root, pretty_print=False)
 		# print(s)
-		
+		return s
+
+	# writeRequest
+	def writeRequest(self, s):
+
 		f = open('curl/MiLoginTicketRequest.xml', 'wb' )
 		f.write(s)
 		f.close()
@@ -78,37 +99,132 @@ class LoginCms:
 		lines = lines.replace("-----END CMS-----", "")
 		return lines
 		
-	# readTA
-	def readTA(self):
+	# parseTA
+	def parseTA(self):
 	
-		dir = ""
-		file = f"{dir}TA.xml"		
+		file = self.taFile
 		doc = etree.parse(file)
 		
-		result = doc.find("*/token") 
-		self.token = result.text
+		token = doc.find("*/token").text
+		sign = doc.find("*/sign").text
 		
-		result = doc.find("*/sign") 
-		self.sign = result.text
-		
-		result = doc.find("*/destination") 
-		res = re.findall(r'\d+', result.text)
-		self.cuit = res[0]
+		# a configured cuit is represented through the certificate owner's ticket
+		cuit = self.cuit
+		if cuit is None:
+			result = doc.find("*/destination") 
+			cuit = re.findall(r'\d+', result.text)[0]
+
+		expiration = datetime.fromisoformat(doc.find("*/expirationTime").text)
+		return Ticket(token, sign, cuit, expiration)
+
+	# readTA
+	def readTA(self):
+
+		# called under the lock, readers see the old ticket or the new one
+		self.ticket = self.parseTA()
+		self.scheduleRefresh()
+
+	# getTicket
+	def getTicket(self):
+		self.getToken()
+		return self.ticket
+
+	# writeTA
+	def writeTA(self, ta):
+
+		dir = os.path.dirname(self.taFile)
+		if dir:
+			os.makedirs(dir, exist_ok=True)
+		f = open(self.taFile, 'w')
+		f.write(ta)
+		f.close()
+
+	# isValid
+	def isValid(self):
+
+		ticket = self.ticket
+		if ticket is None:
+			return False
+		return datetime.now(ticket.expiration.tzinfo) < ticket.expiration
+
+	# scheduleRefresh
+	def scheduleRefresh(self):
+
+		self.close()
+		if not self.proactive:
+			return
+
+		# renew shortly before expiry so callers never wait on loginCms
+		expiration = self.ticket.expiration
+		now = datetime.now(expiration.tzinfo)
+		delay = (expiration - self.refreshMargin - now).total_seconds()
+		if delay <= 0:
+			return
+
+		self._timer = threading.Timer(delay, self.refresh)
+		self._timer.daemon = True
+		self._timer.start()
+
+	# refresh
+	def refresh(self):
+
+		try:
+			self.getNewToken()
+		except Exception as e:
+			self.logger.warning('Token refresh failed: %s', e)
 
 	# getNewToken
 	def getNewToken(self):
 
-		self.buildRequest()
-		self.buildRequestCms()
-		in0 = self.extractParam()
+		# callers that waited on someone else's renewal use its ticket
+		ticket = self.ticket
+		with self._lock:
+			if self.ticket is not ticket:
+				return
+			self.renew()
+
+	# renew
+	def renew(self):
+
+		# called under the lock
+		s = self.buildRequest()
+		if self.signer is not None:
+			in0 = self.signer.sign(s)
+		else:
+			# openssl reference path
+			self.writeRequest(s)
+			self.buildRequestCms()
+			in0 = self.extractParam()
+
 		self.logger.info('Running loginCms')
-		print(self.client.service.loginCms(in0))
+		with self.metrics.measure('loginCms'):
+			ta = self.client.service.loginCms(in0)
+		self.writeTA(ta)
+		self.readTA()
 
 	# getToken
-	def getToken(self):	
-		self.logger.info('Reading current token')	
-		self.readTA()
+	def getToken(self):
+
+		if self.isValid():
+			return
+
+		with self._lock:
+			if self.isValid():
+				return
 
+			if os.path.exists(self.taFile):
+				self.logger.info('Reading current token')
+				self.readTA()
+				if self.isValid():
+					return
 
+			# expired, a stale ticket would only be rejected by AFIP; refresh
+			# keeps the current one while it is still valid
+			self.renew()
 
+	# close
+	def close(self):
 
+		if self._timer is not None:
+			self._timer.cancel()
+			self._timer = None
@@ -0,0 +1,176 @@
+import bisect
+import contextlib
+import contextvars
+import json
+import threading
+import time
+
+# latency histogram upper bounds, in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# the operation in flight on this thread or task
+_current = contextvars.ContextVar("afipOperation", default=None)
+
+
+# current
+def current():
+    return _current.get()
+
+
+# recordTransfer
+def recordTransfer(sent, received):
+
+    # called by the transports, bytes go to the operation in flight
+    record = _current.get()
+    if record is not None:
+        record.sent += sent
+        record.received += received
+
+
+# recordRetry
+def recordRetry():
+    record = _current.get()
+    if record is not None:
+        record.retries += 1
+
+
+# Record
+class Record:
+
+    __slots__ = ("sent", "received", "retries", "codes", "error")
+
+    # __init__
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.retries = 0
+        self.codes = ()
+        self.error = None
+
+
+# OperationStats
+class OperationStats:
+
+    # __init__
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.seconds = 0.0
+        self.sent = 0
+        self.received = 0
+        self.retries = 0
+        self.errors = {}
+
+    # add
+    def add(self, seconds, record):
+
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.seconds += seconds
+        self.sent += record.sent
+        self.received += record.received
+        self.retries += record.retries
+        for code in record.codes:
+            self.errors[code] = self.errors.get(code, 0) + 1
+        if record.error is not None:
+            self.errors[record.error] = self.errors.get(record.error, 0) + 1
+
+    # cumulative
+    def cumulative(self):
+
+        total = 0
+        result = []
+        for count in self.buckets:
+            total += count
+            result.append(total)
+        return result
+
+
+# Metrics
+class Metrics:
+
+    # __init__
+    def __init__(self):
+        self._operations = {}
+        self._lock = threading.Lock()
+
+    # measure
+    @contextlib.contextmanager
+    def measure(self, name):
+
+        record = Record()
+        token = _current.set(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record.error = type(e).__name__
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            _current.reset(token)
+            with self._lock:
+                stats = self._operations.get(name)
+                if stats is None:
+                    stats = self._operations[name] = OperationStats()
+                stats.add(seconds, record)
+
+    # reset
+    def reset(self):
+        with self._lock:
+            self._operations = {}
+
+    # snapshot
+    def snapshot(self):
+
+        result = {}
+        with self._lock:
+            for name, stats in self._operations.items():
+                result[name] = {
+                    "count": stats.count,
+                    "seconds": stats.seconds,
+                    "buckets": dict(zip(LATENCY_BUCKETS + ("+Inf",), stats.cumulative())),
+                    "requestBytes": stats.sent,
+                    "responseBytes": stats.received,
+                    "retries": stats.retries,
+                    "errors": {str(code): count for code, count in stats.errors.items()},
+                }
+        return result
+
+    # json
+    def json(self):
+        return json.dumps(self.snapshot())
+
+    # prometheus
+    def prometheus(self):
+
+        # text exposition format
+        lines = [
+            "# TYPE afip_operation_duration_seconds histogram",
+        ]
+        snapshot = self.snapshot()
+        for name, stats in snapshot.items():
+            for bound, count in stats["buckets"].items():
+                lines.append(
+                    'afip_operation_duration_seconds_bucket{operation="%s",le="%s"} %d'
+                    % (name, bound, count)
+                )
+            lines.append('afip_operation_duration_seconds_sum{operation="%s"} %f' % (name, stats["seconds"]))
+            lines.append('afip_operation_duration_seconds_count{operation="%s"} %d' % (name, stats["count"]))
+
+        counters = (
+            ("afip_operation_request_bytes_total", "requestBytes"),
+            ("afip_operation_response_bytes_total", "responseBytes"),
+            ("afip_operation_retries_total", "retries"),
+        )
+        for metric, key in counters:
+            lines.append("# TYPE %s counter" % metric)
+            for name, stats in snapshot.items():
+                lines.append('%s{operation="%s"} %d' % (metric, name, stats[key]))
+
+        lines.append("# TYPE afip_operation_errors_total counter")
+        for name, stats in snapshot.items():
+            for code, count in stats["errors"].items():
+                lines.append('afip_operation_errors_total{operation="%s",code="%s"} %d' % (name, code, count))
+
+        return "\n".join(lines) + "\n"
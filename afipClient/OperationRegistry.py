@@ -0,0 +1,49 @@
+import importlib
+import threading
+
+
+# OperationRegistry
+class OperationRegistry:
+
+    # operation classes registered by name, shared by every client
+    _classes = {}
+    _classesLock = threading.Lock()
+
+    # __init__
+    def __init__(self, client):
+        self.client = client
+        self._operations = {}
+        self._lock = threading.Lock()
+
+    # register
+    @classmethod
+    def register(cls, name, operation):
+        with cls._classesLock:
+            cls._classes[name] = operation
+
+    # operationClass
+    @classmethod
+    def operationClass(cls, name):
+
+        operation = cls._classes.get(name)
+        if operation is None:
+            # default operations live in a module named after the class
+            module = importlib.import_module(name)
+            operation = getattr(module, name)
+            cls.register(name, operation)
+        return operation
+
+    # get
+    def get(self, name):
+
+        obj = self._operations.get(name)
+        if obj is not None:
+            return obj
+
+        with self._lock:
+            obj = self._operations.get(name)
+            if obj is None:
+                obj = self.operationClass(name)()
+                obj.setClient(self.client)
+                self._operations[name] = obj
+        return obj
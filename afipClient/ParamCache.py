@@ -0,0 +1,187 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from zeep.helpers import serialize_object
+from Logger import *
+
+# reference tables that only change through AFIP resolutions
+PARAM_TABLES = (
+    "FEParamGetTiposCbte",
+    "FEParamGetTiposConcepto",
+    "FEParamGetTiposDoc",
+    "FEParamGetTiposIva",
+    "FEParamGetTiposMonedas",
+    "FEParamGetTiposOpcional",
+    "FEParamGetTiposPaises",
+    "FEParamGetTiposTributos",
+)
+
+
+# ParamTable
+class ParamTable:
+
+    # __init__
+    def __init__(self, fetched, rows, available=True):
+        self.fetched = fetched
+        self.rows = rows
+        # False when the service answered without the table
+        self.available = available
+        self.index = {str(row.get("Id")): row for row in rows}
+
+
+# ParamCache
+class ParamCache:
+
+    # __init__
+    def __init__(self, type, dir="cache/params", ttl=24 * 60 * 60, missingTtl=60 * 60):
+        self.dir = os.path.join(dir, type)
+        self.ttl = ttl
+        # tables the service does not have are asked for again after this
+        self.missingTtl = missingTtl
+        self.logger = Logger()
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    # isCached
+    def isCached(self, param):
+        return param in PARAM_TABLES
+
+    # path
+    def path(self, param):
+        return os.path.join(self.dir, param + ".json")
+
+    # read
+    def read(self, param):
+
+        file = self.path(param)
+        if not os.path.exists(file):
+            return None
+
+        f = open(file)
+        data = json.load(f)
+        f.close()
+        return ParamTable(data["fetched"], data["rows"], data.get("available", True))
+
+    # write
+    def write(self, param, table):
+
+        os.makedirs(self.dir, exist_ok=True)
+        file = self.path(param)
+        tmp = f"{file}.{os.getpid()}.tmp"
+        f = open(tmp, "w")
+        json.dump(
+            {"fetched": table.fetched, "rows": table.rows, "available": table.available},
+            f,
+            default=str,
+        )
+        f.close()
+        os.replace(tmp, file)
+
+    # cached
+    def cached(self, param):
+
+        table = self._tables.get(param)
+        if table is None:
+            table = self.read(param)
+            if table is not None:
+                with self._lock:
+                    self._tables[param] = table
+        return table
+
+    # fresh
+    def fresh(self, param):
+        table = self.cached(param)
+        if table is None:
+            return None
+        ttl = self.ttl if table.available else self.missingTtl
+        if time.time() - table.fetched < ttl:
+            return table
+        return None
+
+    # store
+    def store(self, param, response):
+
+        # an answer without ResultGet, or none, is kept as a negative entry
+        # and not asked for again until missingTtl passes
+        resultGet = getattr(response, "ResultGet", None)
+        if resultGet is None:
+            errors = getattr(getattr(response, "Errors", None), "Err", None) or []
+            self.logger.warning(
+                "%s not available %s, asking again in %ds", param, [e.Code for e in errors], self.missingTtl
+            )
+            table = ParamTable(time.time(), [], available=False)
+        else:
+            # ResultGet wraps a single list, e.g. ResultGet.IvaTipo
+            result = serialize_object(resultGet, dict)
+            rows = next(iter(result.values())) or []
+            table = ParamTable(time.time(), [dict(row) for row in rows])
+
+        self.write(param, table)
+        with self._lock:
+            self._tables[param] = table
+        return table
+
+    # table
+    def table(self, param, fetch):
+
+        table = self.fresh(param)
+        if table is not None:
+            return table
+
+        try:
+            return self.store(param, fetch(param))
+        except Exception as e:
+            # serve the stale copy while AFIP is unreachable
+            table = self.cached(param)
+            if table is None:
+                raise
+            self.logger.warning("Serving stale %s: %s", param, e)
+            return table
+
+    # warm
+    def warm(self, fetch, workers=8):
+
+        # opt-in, fetch should not count against the circuit breaker
+        stale = [param for param in PARAM_TABLES if self.fresh(param) is None]
+        if not stale:
+            return
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for param, future in [(p, executor.submit(self.table, p, fetch)) for p in stale]:
+                try:
+                    future.result()
+                except Exception as e:
+                    self.logger.warning("Could not warm %s: %s", param, e)
+
+    # isValid
+    def isValid(self, row, today):
+
+        # FchDesde/FchHasta are yyyymmdd, open ended when missing or NULL
+        desde = row.get("FchDesde")
+        hasta = row.get("FchHasta")
+        if desde not in (None, "", "NULL") and desde > today:
+            return False
+        if hasta not in (None, "", "NULL") and hasta < today:
+            return False
+        return True
+
+    # valid
+    def valid(self, table):
+        today = date.today().strftime("%Y%m%d")
+        return [row for row in table.rows if self.isValid(row, today)]
+
+    # lookup
+    def lookup(self, param, id):
+
+        table = self.cached(param)
+        if table is None:
+            return None
+
+        row = table.index.get(str(id))
+        if row is None or not self.isValid(row, date.today().strftime("%Y%m%d")):
+            return None
+        return row
@@ -0,0 +1,212 @@
+from decimal import ROUND_HALF_UP, Decimal
+from types import SimpleNamespace
+
+ZERO = Decimal("0.00")
+CENT = Decimal("0.01")
+
+# AlicIva Id -> rate in percent
+VAT_RATES = {
+    3: Decimal("0.00"),
+    4: Decimal("10.50"),
+    5: Decimal("21.00"),
+    6: Decimal("27.00"),
+    8: Decimal("5.00"),
+    9: Decimal("2.50"),
+}
+
+# receipts issued by monotributistas (Factura, Nota de Debito, Nota de Credito, Recibo C)
+CATEGORY_C = (11, 12, 13, 15)
+
+# AlicIva Importe may differ from BaseImp * rate by this much
+VAT_TOLERANCE = Decimal("0.01")
+
+# same messages the service sends back
+MESSAGES = {
+    10018: "Si ImpIva es igual a 0 el objeto Iva y AlicIva son obligatorios. Id iva = 3 (iva 0)",
+    10020: "El  campo  BaseImp  en AlicIVA es obligatorio  y debe ser mayor a 0 cero.",
+    10023: "La suma de los campos Importe en IVA debe ser igual al valor ingresado en ImpIVA.",
+    10043: (
+        "El campo ImpTotConc (Importe Total del Concepto) para comprobantes tipo C debe ser "
+        "igual a cero (0)."
+    ),
+    10044: "El campo ImpOpEx (importe exento) para comprobantes tipo C debe ser igual a cero (0).",
+    10047: "El campo ImpIVA (Importe de IVA) para comprobantes tipo C debe ser igual a cero (0).",
+    10048: (
+        "El campo  'Importe Total' ImpTotal, debe ser igual  a la  suma de ImpTotConc + ImpNeto "
+        "+ ImpOpEx + ImpTrib + ImpIVA."
+    ),
+    10051: "Los importes informados en AlicIVA no se corresponden con los porcentajes.",
+    10061: (
+        "La suma de los campos BaseImp en AlicIva debe ser igual al valor ingresado en ImpNeto."
+    ),
+    10070: "Si ImpNeto es mayor a 0 el objeto IVA es obligatorio.",
+    10071: "Para comprobantes tipo C el objeto IVA no debe informarse.",
+}
+
+
+# observation
+def observation(code):
+    # shaped like the Obs elements of FECAEDetResponse
+    return SimpleNamespace(Code=code, Msg=MESSAGES[code])
+
+
+# amount
+def amount(value):
+    if value is None:
+        return ZERO
+    if isinstance(value, Decimal):
+        return value
+    return Decimal(str(value))
+
+
+# alicuotas
+def alicuotas(receipt):
+
+    # Iva as the service takes it, {'AlicIva': [...]}, or as a list of
+    # {'AlicIva': {...}} wrappers; None when not informed
+    iva = receipt.get("Iva")
+    if iva is None:
+        return None
+    if isinstance(iva, dict):
+        iva = iva.get("AlicIva")
+        return iva if isinstance(iva, list) else [iva]
+    return [item.get("AlicIva", item) for item in iva]
+
+
+# ReceiptValidator
+class ReceiptValidator:
+
+    # __init__
+    def __init__(self, autoCorrect=False):
+        self.autoCorrect = autoCorrect
+
+    # expectedVat
+    def expectedVat(self, alicIva):
+
+        # None for an Id without a known rate, the service answers 10051
+        try:
+            rate = VAT_RATES.get(int(alicIva["Id"]))
+        except (TypeError, ValueError):
+            rate = None
+        if rate is None:
+            return None
+        return (amount(alicIva["BaseImp"]) * rate / 100).quantize(CENT, ROUND_HALF_UP)
+
+    # validate
+    def validate(self, cbteTipo, receipt):
+
+        # observation codes for one FECAEDetRequest, empty when it would pass
+        total = amount(receipt.get("ImpTotal"))
+        taxes = amount(receipt.get("ImpTrib"))
+        net = amount(receipt.get("ImpNeto"))
+        exempt = amount(receipt.get("ImpOpEx"))
+        untaxed = amount(receipt.get("ImpTotConc"))
+        vat = amount(receipt.get("ImpIVA"))
+        vats = alicuotas(receipt)
+
+        if int(cbteTipo) in CATEGORY_C:
+            codes = []
+            if untaxed != ZERO:
+                codes.append(10043)
+            if exempt != ZERO:
+                codes.append(10044)
+            if vat != ZERO:
+                codes.append(10047)
+            if net + taxes != total:
+                codes.append(10048)
+            if vats is not None:
+                codes.append(10071)
+            return codes
+
+        base = ZERO
+        vatFromAlicuotas = ZERO
+        if vats is not None:
+            for alicIva in vats:
+                # the service reports only the first of these
+                if amount(alicIva["BaseImp"]) == ZERO:
+                    return [10020]
+                expected = self.expectedVat(alicIva)
+                if expected is None or abs(amount(alicIva["Importe"]) - expected) > VAT_TOLERANCE:
+                    return [10051]
+                if int(alicIva["Id"]) != 3 and vat == ZERO:
+                    return [10018]
+                base += amount(alicIva["BaseImp"])
+                vatFromAlicuotas += amount(alicIva["Importe"])
+        elif net > ZERO:
+            return [10070]
+
+        codes = []
+        if untaxed + net + exempt + taxes + vat != total:
+            codes.append(10048)
+        if vat != vatFromAlicuotas:
+            codes.append(10023)
+        if net != base:
+            codes.append(10061)
+        return codes
+
+    # correct
+    def correct(self, cbteTipo, receipt):
+
+        # recomputes the derived amounts, what the seller entered (net,
+        # exempt, untaxed, taxes and VAT bases) is left as is
+        receipt = dict(receipt)
+        if int(cbteTipo) in CATEGORY_C:
+            receipt["ImpTotal"] = amount(receipt.get("ImpNeto")) + amount(receipt.get("ImpTrib"))
+            return receipt
+
+        vats = alicuotas(receipt)
+        if vats is not None:
+            # an unknown Id keeps its amount and is rejected by validate
+            corrected = []
+            for alicIva in vats:
+                expected = self.expectedVat(alicIva)
+                if expected is not None:
+                    alicIva = dict(alicIva, Importe=expected)
+                corrected.append(alicIva)
+            vats = corrected
+            if isinstance(receipt["Iva"], dict):
+                receipt["Iva"] = {"AlicIva": vats}
+            else:
+                receipt["Iva"] = [{"AlicIva": alicIva} for alicIva in vats]
+            receipt["ImpIVA"] = sum((alicIva["Importe"] for alicIva in vats), ZERO)
+
+        receipt["ImpTotal"] = sum(
+            (
+                amount(receipt.get(name))
+                for name in ("ImpTotConc", "ImpNeto", "ImpOpEx", "ImpTrib", "ImpIVA")
+            ),
+            ZERO,
+        )
+        return receipt
+
+    # rejected
+    def rejected(self, codes):
+        # shaped like a FECAEDetResponse the service rejected
+        return SimpleNamespace(
+            Resultado="R",
+            CAE=None,
+            Observaciones=SimpleNamespace(Obs=[observation(code) for code in codes]),
+        )
+
+    # screen
+    def screen(self, cbteTipo, receipts, consecutive=False):
+
+        # returns (results, indexes, valid): results holds a rejection for
+        # every invalid receipt, valid are the receipts still to send and
+        # indexes their positions; with consecutive numbering nothing after
+        # the first invalid receipt is sent
+        results = [None] * len(receipts)
+        indexes = []
+        valid = []
+        for index, receipt in enumerate(receipts):
+            if self.autoCorrect:
+                receipt = self.correct(cbteTipo, receipt)
+            codes = self.validate(cbteTipo, receipt)
+            if codes:
+                results[index] = self.rejected(codes)
+                if consecutive:
+                    break
+                continue
+            indexes.append(index)
+            valid.append(receipt)
+        return results, indexes, valid
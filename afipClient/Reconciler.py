@@ -0,0 +1,195 @@
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from decimal import Decimal
+
+from Resilience import NOT_FOUND_ERRORS, errorCodes
+
+MISSING = "missing"
+EXTRA = "extra"
+AMOUNT = "amount"
+CAE = "cae"
+ERROR = "error"
+
+
+# Difference
+class Difference:
+
+    # __init__
+    def __init__(self, kind, ptoVta, cbteTipo, cbteNro, local=None, remote=None):
+        self.kind = kind
+        self.ptoVta = ptoVta
+        self.cbteTipo = cbteTipo
+        self.cbteNro = cbteNro
+        self.local = local
+        self.remote = remote
+
+    # __repr__
+    def __repr__(self):
+        return "Difference(%s, %d, %d, %d, local=%r, remote=%r)" % (
+            self.kind,
+            self.ptoVta,
+            self.cbteTipo,
+            self.cbteNro,
+            self.local,
+            self.remote,
+        )
+
+
+# Checkpoint
+class Checkpoint:
+
+    # __init__
+    def __init__(self, file=None, saveEvery=100):
+
+        # per range, every number up to the mark has been checked
+        self.file = file
+        self.saveEvery = saveEvery
+        self.marks = {}
+        self._done = {}
+        self._unsaved = 0
+
+        if file is not None and os.path.exists(file):
+            f = open(file)
+            self.marks = json.load(f)
+            f.close()
+
+    # key
+    def key(self, span):
+        return "%d-%d-%d-%d" % span
+
+    # start
+    def start(self, span):
+        desde = span[2]
+        return max(self.marks.get(self.key(span), desde - 1), desde - 1) + 1
+
+    # complete
+    def complete(self, span, cbteNro):
+
+        key = self.key(span)
+        done = self._done.setdefault(key, set())
+        done.add(cbteNro)
+
+        mark = self.marks.get(key, span[2] - 1)
+        while mark + 1 in done:
+            mark += 1
+            done.discard(mark)
+        self.marks[key] = mark
+
+        self._unsaved += 1
+        if self._unsaved >= self.saveEvery:
+            self.save()
+
+    # save
+    def save(self):
+
+        self._unsaved = 0
+        if self.file is None:
+            return
+
+        dir = os.path.dirname(self.file)
+        if dir:
+            os.makedirs(dir, exist_ok=True)
+
+        tmp = f"{self.file}.{os.getpid()}.tmp"
+        f = open(tmp, "w")
+        json.dump(self.marks, f)
+        f.close()
+        os.replace(tmp, self.file)
+
+
+# Reconciler
+class Reconciler:
+
+    # __init__
+    def __init__(self, client, lookup, checkpoint=None, concurrency=8):
+
+        # lookup(ptoVta, cbteTipo, cbteNro) returns the local receipt, a dict
+        # with ImpTotal and CAE, or None when we never issued that number
+        self.client = client
+        self.lookup = lookup
+        self.checkpoint = Checkpoint(checkpoint)
+        self.concurrency = concurrency
+
+    # numbers
+    def numbers(self, ranges):
+
+        # ranges: (ptoVta, cbteTipo, desde, hasta), resumed after the checkpoint
+        for span in ranges:
+            span = tuple(int(v) for v in span)
+            for cbteNro in range(self.checkpoint.start(span), span[3] + 1):
+                yield span, cbteNro
+
+    # run
+    def run(self, ranges):
+
+        # yields differences as soon as they are found; receipts checked after
+        # the last saved mark may be checked again after an interruption
+        window = self.concurrency * 4
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            pending = set()
+            try:
+                for span, cbteNro in self.numbers(ranges):
+                    if len(pending) >= window:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        yield from self.collect(done)
+                    pending.add(executor.submit(self.check, span, cbteNro))
+
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    yield from self.collect(done)
+            finally:
+                for future in pending:
+                    future.cancel()
+                self.checkpoint.save()
+
+    # collect
+    def collect(self, futures):
+
+        for future in futures:
+            span, cbteNro, differences = future.result()
+            yield from differences
+            # only once the caller took the differences; failed queries stay
+            # below the mark and are retried on resume
+            if not any(d.kind == ERROR for d in differences):
+                self.checkpoint.complete(span, cbteNro)
+
+    # check
+    def check(self, span, cbteNro):
+
+        ptoVta, cbteTipo = span[:2]
+        try:
+            response = self.client.fECompConsultar(ptoVta, cbteTipo, cbteNro)
+        except Exception as e:
+            return span, cbteNro, [Difference(ERROR, ptoVta, cbteTipo, cbteNro, remote=str(e))]
+
+        codes = errorCodes(response)
+        if codes and not set(codes) <= set(NOT_FOUND_ERRORS):
+            return span, cbteNro, [Difference(ERROR, ptoVta, cbteTipo, cbteNro, remote=codes)]
+
+        remote = None if codes else response.ResultGet
+        local = self.lookup(ptoVta, cbteTipo, cbteNro)
+        return span, cbteNro, self.compare(ptoVta, cbteTipo, cbteNro, local, remote)
+
+    # compare
+    def compare(self, ptoVta, cbteTipo, cbteNro, local, remote):
+
+        if remote is None:
+            if local is None:
+                return []
+            return [Difference(MISSING, ptoVta, cbteTipo, cbteNro, local=local)]
+
+        if local is None:
+            return [Difference(EXTRA, ptoVta, cbteTipo, cbteNro, remote=remote)]
+
+        differences = []
+        if Decimal(str(local["ImpTotal"])) != Decimal(str(remote.ImpTotal)):
+            differences.append(
+                Difference(AMOUNT, ptoVta, cbteTipo, cbteNro, local["ImpTotal"], remote.ImpTotal)
+            )
+        if str(local.get("CAE")) != str(remote.CodAutorizacion):
+            differences.append(
+                Difference(CAE, ptoVta, cbteTipo, cbteNro, local.get("CAE"), remote.CodAutorizacion)
+            )
+        return differences
+
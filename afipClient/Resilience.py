@@ -0,0 +1,229 @@
+import asyncio
+import random
+import threading
+import time
+
+import requests
+from zeep.exceptions import TransportError
+from Logger import *
+from Metrics import recordRetry
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+# AFIP error codes
+AUTH_ERRORS = (600,)
+TRANSIENT_ERRORS = (500, 501, 502)
+
+# FECompConsultar: no receipt with those parameters
+NOT_FOUND_ERRORS = (602,)
+
+TRANSIENT = "transient"
+AUTH = "auth"
+PERMANENT = "permanent"
+
+
+# CircuitOpenError
+class CircuitOpenError(Exception):
+    None
+
+
+# AfipError
+class AfipError(Exception):
+
+    # __init__
+    def __init__(self, code, response):
+        super().__init__("AFIP error %d" % code)
+        self.code = code
+        self.response = response
+
+
+# errorCodes
+def errorCodes(response):
+    errors = getattr(response, "Errors", None)
+    errs = getattr(errors, "Err", None) or []
+    return [err.Code for err in errs]
+
+
+# Resilience
+class Resilience:
+
+    # __init__
+    def __init__(
+        self,
+        retries=3,
+        baseDelay=0.5,
+        maxDelay=8,
+        failureThreshold=5,
+        resetTimeout=30,
+    ):
+        self.retries = retries
+        self.baseDelay = baseDelay
+        self.maxDelay = maxDelay
+        self.failureThreshold = failureThreshold
+        self.resetTimeout = resetTimeout
+        self.logger = Logger()
+
+        self._failures = 0
+        self._openedAt = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    # classify
+    def classify(self, error, idempotent=True):
+
+        if isinstance(error, AfipError):
+            if error.code in AUTH_ERRORS:
+                return AUTH
+            if error.code in TRANSIENT_ERRORS:
+                return TRANSIENT
+            return PERMANENT
+
+        # a request that never reached the server is always safe to repeat
+        if isinstance(error, requests.ConnectTimeout):
+            return TRANSIENT
+        if httpx is not None and isinstance(error, httpx.ConnectError):
+            return TRANSIENT
+
+        # after the request was sent only idempotent operations are repeated
+        if not idempotent:
+            return PERMANENT
+        if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+            return TRANSIENT
+        if isinstance(error, TransportError) and error.status_code >= 500:
+            return TRANSIENT
+        if httpx is not None and isinstance(error, httpx.TransportError):
+            return TRANSIENT
+        return PERMANENT
+
+    # check
+    def check(self, response):
+
+        # AFIP reports some failures inside a successful SOAP response
+        for code in errorCodes(response):
+            if code in AUTH_ERRORS or code in TRANSIENT_ERRORS:
+                raise AfipError(code, response)
+        return response
+
+    # delay
+    def delay(self, attempt):
+        # full jitter
+        return random.uniform(0, min(self.maxDelay, self.baseDelay * 2 ** attempt))
+
+    # before
+    def before(self):
+
+        with self._lock:
+            if self._openedAt is None:
+                return
+            if time.monotonic() - self._openedAt < self.resetTimeout or self._trial:
+                raise CircuitOpenError("AFIP circuit open")
+            # half open, let one call through
+            self._trial = True
+
+    # success
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._openedAt = None
+            self._trial = False
+
+    # answered
+    def answered(self):
+        # the server replied with an error: end a half open trial without
+        # closing the circuit, only a real success does that
+        with self._lock:
+            self._trial = False
+
+    # failure
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial = False
+            if self._failures >= self.failureThreshold or self._openedAt is not None:
+                if self._openedAt is None:
+                    self.logger.warning("Opening AFIP circuit")
+                self._openedAt = time.monotonic()
+
+    # outcome
+    def outcome(self, error, attempt, reauthed, idempotent):
+
+        # returns 'reauth', 'retry' or 'fail'
+        kind = self.classify(error, idempotent)
+        if kind == AUTH:
+            if reauthed:
+                self.answered()
+                return "fail"
+            return "reauth"
+
+        if kind == PERMANENT:
+            # the server answered, unless the connection dropped mid call
+            if self.classify(error) == TRANSIENT:
+                self.failure()
+            else:
+                self.answered()
+            return "fail"
+
+        self.failure()
+        return "fail" if attempt >= self.retries else "retry"
+
+    # fail
+    def fail(self, error):
+        # errors AFIP reports in the response go back to the caller as before
+        if isinstance(error, AfipError):
+            return error.response
+        raise error
+
+    # call
+    def call(self, fn, reauth, idempotent=True):
+
+        reauthed = False
+        attempt = 0
+        self.before()
+        while True:
+            try:
+                response = self.check(fn())
+                self.success()
+                return response
+            except Exception as error:
+                action = self.outcome(error, attempt, reauthed, idempotent)
+                if action == "fail":
+                    return self.fail(error)
+                if action == "reauth":
+                    self.logger.warning("Token rejected, renewing and replaying")
+                    recordRetry()
+                    reauth()
+                    reauthed = True
+                    continue
+                recordRetry()
+                time.sleep(self.delay(attempt))
+                attempt += 1
+                self.before()
+
+    # callAsync
+    async def callAsync(self, fn, reauth, idempotent=True):
+
+        reauthed = False
+        attempt = 0
+        self.before()
+        while True:
+            try:
+                response = self.check(await fn())
+                self.success()
+                return response
+            except Exception as error:
+                action = self.outcome(error, attempt, reauthed, idempotent)
+                if action == "fail":
+                    return self.fail(error)
+                if action == "reauth":
+                    self.logger.warning("Token rejected, renewing and replaying")
+                    recordRetry()
+                    await asyncio.to_thread(reauth)
+                    reauthed = True
+                    continue
+                recordRetry()
+                await asyncio.sleep(self.delay(attempt))
+                attempt += 1
+                self.before()
@@ -0,0 +1,263 @@
+from array import array
+from collections.abc import Sequence
+
+# ResultGet fields kept from FECompConsultar
+RESULT_GET_FIELDS = (
+    "PtoVta",
+    "CbteTipo",
+    "CbteDesde",
+    "CbteHasta",
+    "CbteFch",
+    "ImpTotal",
+    "Resultado",
+    "CodAutorizacion",
+    "EmisionTipo",
+    "FchVto",
+)
+
+# Resultado of receipts sent without an answer, AfipClient.recover
+# resolves them
+IN_DOUBT = "D"
+
+
+# BatchError
+class BatchError(Exception):
+
+    # __init__
+    def __init__(self, error, results):
+        # results as returned for the whole batch: chunks answered before
+        # the error, IN_DOUBT for the one that failed, None for those unsent
+        super().__init__("Batch stopped: %s" % error)
+        self.error = error
+        self.results = results
+
+
+# Message
+class Message:
+
+    # an Obs, Err or Evt entry
+    __slots__ = ("Code", "Msg")
+
+    # __init__
+    def __init__(self, Code, Msg):
+        self.Code = Code
+        self.Msg = Msg
+
+    # __repr__
+    def __repr__(self):
+        return "Message(%r, %r)" % (self.Code, self.Msg)
+
+
+# Observations
+class Observations:
+
+    # same shape as Observaciones, entries under Obs
+    __slots__ = ("Obs",)
+
+    # __init__
+    def __init__(self, Obs):
+        self.Obs = Obs
+
+
+# Errors
+class Errors:
+
+    # same shape as Errors, entries under Err
+    __slots__ = ("Err",)
+
+    # __init__
+    def __init__(self, Err):
+        self.Err = Err
+
+
+# CaeDetail
+class CaeDetail:
+
+    # what we use of a FECAEDetResponse
+    __slots__ = ("CbteDesde", "CbteHasta", "Resultado", "CAE", "CAEFchVto", "Observaciones")
+
+    # __init__
+    def __init__(self, CbteDesde, CbteHasta, Resultado, CAE, CAEFchVto, Observaciones):
+        self.CbteDesde = CbteDesde
+        self.CbteHasta = CbteHasta
+        self.Resultado = Resultado
+        self.CAE = CAE
+        self.CAEFchVto = CAEFchVto
+        self.Observaciones = Observaciones
+
+    # __repr__
+    def __repr__(self):
+        return "CaeDetail(%r, %s, %r, %r)" % (self.CbteDesde, self.Resultado, self.CAE, self.CAEFchVto)
+
+
+# ConsultResult
+class ConsultResult:
+
+    # what we use of a FECompConsultar ResultGet
+    __slots__ = RESULT_GET_FIELDS
+
+    # __init__
+    def __init__(self, source):
+        for name in RESULT_GET_FIELDS:
+            setattr(self, name, getattr(source, name, None))
+
+
+# ConsultResponse
+class ConsultResponse:
+
+    # FECompConsultar without Events and the receipt's item detail
+    __slots__ = ("ResultGet", "Errors")
+
+    # __init__
+    def __init__(self, ResultGet, Errors):
+        self.ResultGet = ResultGet
+        self.Errors = Errors
+
+
+# messages
+def messages(container, name):
+
+    # Observaciones.Obs / Errors.Err as a tuple of Message, None when empty
+    entries = getattr(container, name, None) if container is not None else None
+    if not entries:
+        return None
+    return tuple(Message(e.Code, e.Msg) for e in entries)
+
+
+# compactDetail
+def compactDetail(detail):
+
+    if detail is None or isinstance(detail, CaeDetail):
+        return detail
+    # local rejections (see ReceiptValidator) carry no numbers
+    obs = messages(getattr(detail, "Observaciones", None), "Obs")
+    return CaeDetail(
+        getattr(detail, "CbteDesde", None),
+        getattr(detail, "CbteHasta", None),
+        detail.Resultado,
+        getattr(detail, "CAE", None),
+        getattr(detail, "CAEFchVto", None),
+        Observations(obs) if obs else None,
+    )
+
+
+# compactErrors
+def compactErrors(errors):
+    err = messages(errors, "Err")
+    return Errors(err) if err else None
+
+
+# compactConsult
+def compactConsult(response):
+    resultGet = response.ResultGet
+    return ConsultResponse(
+        ConsultResult(resultGet) if resultGet is not None else None,
+        compactErrors(response.Errors),
+    )
+
+
+# TextColumn
+class TextColumn:
+
+    # fixed width ascii, longer values (never seen for CAE or dates) aside
+
+    # __init__
+    def __init__(self, width):
+        self.width = width
+        self.data = bytearray()
+        self.overflow = {}
+
+    # append
+    def append(self, value):
+
+        value = "" if value is None else str(value)
+        raw = value.encode("ascii", "replace")
+        if len(raw) > self.width or raw != raw.strip() or len(raw) != len(value):
+            self.overflow[len(self.data) // self.width] = value
+            raw = b""
+        self.data += raw.ljust(self.width)
+
+    # get
+    def get(self, index):
+
+        value = self.overflow.get(index)
+        if value is not None:
+            return value
+        start = index * self.width
+        value = self.data[start : start + self.width].rstrip().decode("ascii")
+        return value or None
+
+
+# CaeResults
+class CaeResults(Sequence):
+
+    # FECAESolicitar results of a batch as columns, about 40 bytes a receipt
+    # instead of a response graph; None for receipts that were not sent
+
+    # __init__
+    def __init__(self, details=()):
+
+        self._cbteDesde = array("q")
+        self._cbteHasta = array("q")
+        self._resultado = bytearray()
+        self._cae = TextColumn(14)
+        self._caeFchVto = TextColumn(8)
+        self._observaciones = {}
+        for detail in details:
+            self.append(detail)
+
+    # append
+    def append(self, detail):
+
+        index = len(self._resultado)
+        if detail is None:
+            self._cbteDesde.append(0)
+            self._cbteHasta.append(0)
+            self._resultado.append(0)
+            self._cae.append(None)
+            self._caeFchVto.append(None)
+            return
+
+        detail = compactDetail(detail)
+        self._cbteDesde.append(detail.CbteDesde or 0)
+        self._cbteHasta.append(detail.CbteHasta or 0)
+        self._resultado += (detail.Resultado or " ")[:1].encode("ascii")
+        self._cae.append(detail.CAE)
+        self._caeFchVto.append(detail.CAEFchVto)
+        if detail.Observaciones is not None:
+            self._observaciones[index] = detail.Observaciones
+
+    # __len__
+    def __len__(self):
+        return len(self._resultado)
+
+    # __getitem__
+    def __getitem__(self, index):
+
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+
+        resultado = self._resultado[index]
+        if resultado == 0:
+            return None
+        return CaeDetail(
+            self._cbteDesde[index] or None,
+            self._cbteHasta[index] or None,
+            chr(resultado).strip() or None,
+            self._cae.get(index),
+            self._caeFchVto.get(index),
+            self._observaciones.get(index),
+        )
+
+
+# mergeResults
+def mergeResults(results, indexes, details):
+
+    # details of the receipts sent, back in place among the local rejections
+    for index, detail in zip(indexes, details):
+        results[index] = detail
+    return CaeResults(results)
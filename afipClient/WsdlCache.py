@@ -0,0 +1,78 @@
+import hashlib
+import os
+import shutil
+import threading
+
+from zeep.cache import Base
+from zeep.wsdl import Document
+from Logger import *
+
+# bump when the cached layout or the service definitions change
+WSDL_CACHE_VERSION = "1"
+
+# parsed documents shared by every client in this process
+_documents = {}
+_documentsLock = threading.Lock()
+
+
+# WsdlCache
+class WsdlCache(Base):
+
+    # __init__
+    def __init__(self, type, dir="cache/wsdl", version=WSDL_CACHE_VERSION):
+        self.type = type
+        self.version = version
+        self.dir = os.path.join(dir, version, type)
+        self.logger = Logger()
+
+    # path
+    def path(self, url):
+        name = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.dir, name + ".xml")
+
+    # add
+    def add(self, url, content):
+
+        os.makedirs(self.dir, exist_ok=True)
+        file = self.path(url)
+
+        # write aside and rename so concurrent workers never read a partial file
+        tmp = f"{file}.{os.getpid()}.tmp"
+        f = open(tmp, "wb")
+        f.write(content)
+        f.close()
+        os.replace(tmp, file)
+
+    # get
+    def get(self, url):
+
+        file = self.path(url)
+        if not os.path.exists(file):
+            return None
+
+        f = open(file, "rb")
+        content = f.read()
+        f.close()
+        return content
+
+    # load
+    def load(self, url, transport):
+
+        key = (self.version, self.type, url)
+        with _documentsLock:
+            document = _documents.get(key)
+            if document is None:
+                self.logger.info("Parsing %s", url)
+                document = Document(url, transport)
+                _documents[key] = document
+        return document
+
+    # invalidate
+    def invalidate(self):
+
+        self.logger.info("Invalidating wsdl cache %s", self.dir)
+        with _documentsLock:
+            for key in list(_documents):
+                if key[0] == self.version and key[1] == self.type:
+                    del _documents[key]
+        shutil.rmtree(self.dir, ignore_errors=True)
@@ -1,3 +1,5 @@
+import copy
+
 from Logger import *
 
 
@@ -17,3 +19,11 @@ class Wsfe:
     # setAuth
     def setAuth(self, auth):
         self._auth = auth
+
+    # bind
+    def bind(self, auth):
+        # a copy for one call, the registry's instance is shared by every
+        # thread and coroutine of the client and is never given an auth
+        bound = copy.copy(self)
+        bound._auth = auth
+        return bound
@@ -0,0 +1,154 @@
+import sys
+sys.path.insert(0, '.')
+
+import argparse
+import time
+from types import SimpleNamespace
+
+from lxml import etree
+from AfipClient import *
+
+AUTH = {"Token": "T" * 800, "Sign": "S" * 172, "Cuit": "20111111112"}
+
+RECEIPT = {
+    "Concepto": 1,
+    "DocTipo": 80,
+    "DocNro": "20111111112",
+    "CbteFch": "20210928",
+    "ImpTotal": 121.00,
+    "ImpTotConc": 0,
+    "ImpNeto": 100,
+    "ImpOpEx": 0,
+    "ImpTrib": 0,
+    "ImpIVA": 21,
+    "MonId": "PES",
+    "MonCotiz": 1,
+    "Iva": [{"AlicIva": {"Id": 5, "BaseImp": 100, "Importe": 21}}],
+}
+
+
+# response
+def response(operation, count):
+
+    # serialized by zeep itself so the reply matches whichever wsdl is loaded
+    details = [
+        {
+            "Concepto": 1, "DocTipo": 80, "DocNro": 20111111112,
+            "CbteDesde": i + 1, "CbteHasta": i + 1, "CbteFch": "20210928",
+            "Resultado": "A", "CAE": "71234567890123", "CAEFchVto": "20211008",
+        }
+        for i in range(count)
+    ]
+    result = {
+        "FeCabResp": {"Cuit": 20111111112, "PtoVta": 1, "CbteTipo": 1, "CantReg": count, "Resultado": "A"},
+        "FeDetResp": {"FECAEDetResponse": details},
+    }
+    message = operation.output.serialize(FECAESolicitarResult=result)
+    return etree.tostring(message.content)
+
+
+# measure
+def measure(name, fn, rounds):
+
+    fn()
+    start = time.perf_counter()
+    for i in range(rounds):
+        fn()
+    elapsed = time.perf_counter() - start
+    print("%-24s %9.3f ms/call" % (name, elapsed * 1000 / rounds))
+
+
+# summary
+def summary(result):
+
+    # what the caller acts on, comparable between zeep and the fast path
+    codes = lambda errors: [e.Code for e in errors.Err] if errors else []
+    feDetResp = result.FeDetResp
+    details = getattr(feDetResp, "FECAEDetResponse", feDetResp) or []
+    return (
+        result.FeCabResp.Resultado if result.FeCabResp else None,
+        [(d.CbteDesde, d.Resultado, codes(d.Observaciones and SimpleNamespace(Err=d.Observaciones.Obs))) for d in details],
+        codes(result.Errors),
+    )
+
+
+# roundTrip
+def roundTrip(client, fastPath, ptoVta, count):
+
+    # the same requests through zeep and the fast path against a live server
+    auth = client.buildAuth()
+    service = client.wsfe.service
+    fast = fastPath.fECompUltimoAutorizado(auth, ptoVta, 1)
+    reference = service.FECompUltimoAutorizado(Auth=auth, PtoVta=ptoVta, CbteTipo=1)
+    print("FECompUltimoAutorizado zeep %s, fast path %s" % (reference.CbteNro, fast.CbteNro))
+    matches = fast.CbteNro == reference.CbteNro
+
+    cbteNro = fast.CbteNro or 0
+    fast = summary(fastPath.fECAESolicitar(auth, ptoVta, 1, [RECEIPT] * count, cbteNro + 1))
+    details = [
+        dict(RECEIPT, CbteDesde=cbteNro + count + i + 1, CbteHasta=cbteNro + count + i + 1)
+        for i in range(count)
+    ]
+    feCAEReq = {
+        "FeCabReq": {"CantReg": count, "PtoVta": ptoVta, "CbteTipo": 1},
+        "FeDetReq": {"FECAEDetRequest": details},
+    }
+    reference = summary(service.FECAESolicitar(Auth=auth, FeCAEReq=feCAEReq))
+    # numbers differ by design, the second batch follows the first
+    reference = (reference[0], [(d - count, resultado, obs) for d, resultado, obs in reference[1]], reference[2])
+    print("FECAESolicitar zeep %s\nFECAESolicitar fast path %s" % (reference, fast))
+    return matches and fast == reference and fast[0] == "A"
+
+
+if __name__ == "__main__":
+
+    # run from afipClient/ once the wsdl is cached: python benchmarks/fastpath.py bsdu
+    parser = argparse.ArgumentParser()
+    parser.add_argument("type", nargs="?", default="bsdu")
+    parser.add_argument("--receipts", type=int, default=250)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--live", action="store_true", help="send to the server and compare with zeep")
+    parser.add_argument("--pto-vta", type=int, default=1)
+    args = parser.parse_args()
+
+    client = AfipClient(args.type)
+    fastPath = FastPath(client.wsfe, client.transport)
+    if args.live:
+        sys.exit(0 if roundTrip(client, fastPath, args.pto_vta, min(args.receipts, 10)) else 1)
+    wsfe = client.wsfe
+    binding = wsfe.service._binding
+    operation = binding.get("FECAESolicitar")
+
+    receipts = [RECEIPT] * args.receipts
+    details = []
+    for i, receipt in enumerate(receipts):
+        detail = dict(receipt, CbteDesde=i + 1, CbteHasta=i + 1)
+        details.append(detail)
+    feCAEReq = {
+        "FeCabReq": {"CantReg": len(details), "PtoVta": 1, "CbteTipo": 1},
+        "FeDetReq": {"FECAEDetRequest": details},
+    }
+    content = response(operation, args.receipts)
+    reply = SimpleNamespace(status_code=200, content=content, headers={}, encoding="utf-8")
+
+    print("FECAESolicitar with %d receipts" % args.receipts)
+    measure(
+        "zeep render",
+        lambda: etree.tostring(wsfe.create_message(wsfe.service, "FECAESolicitar", Auth=AUTH, FeCAEReq=feCAEReq)),
+        args.rounds,
+    )
+    measure(
+        "fast path render",
+        lambda: fastPath.renderFECAESolicitar(AUTH, 1, 1, details),
+        args.rounds,
+    )
+    measure(
+        "zeep parse",
+        lambda: binding.process_reply(wsfe, operation, reply),
+        args.rounds,
+    )
+    measure(
+        "fast path parse",
+        lambda: fastPath.parseFECAESolicitar(etree.fromstring(content)),
+        args.rounds,
+    )
@@ -0,0 +1,108 @@
+import sys
+sys.path.insert(0, '.')
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from AfipClient import *
+from benchmarks.fastpath import RECEIPT
+
+
+# buildClient
+def buildClient(args):
+
+    # the mock takes any ticket, no loginCms round trip
+    loginCms = LoginCms(proactive=False)
+    loginCms.ticket = Ticket("token", "sign", "20111111112", datetime.now(timezone.utc) + timedelta(hours=12))
+    client = AfipClient(args.type, loginCms=loginCms)
+    client.numbers = CbteNroAllocator(client.scope, client.lastCbteNro, dir=args.dir)
+    return client
+
+
+# worker
+def worker(args, results):
+
+    # threads of one process share its allocator, processes share the file
+    client = buildClient(args)
+
+    def batch(i):
+        results = client.authorizeBatch(args.ptoVta, args.cbteTipo, [RECEIPT] * args.size)
+        return [(r.CbteDesde, r.Resultado, r.CAE) for r in results]
+
+    with ThreadPoolExecutor(args.threads) as executor:
+        batches = executor.map(batch, range(args.threads * args.batches))
+        results.put([d for details in batches for d in details])
+
+
+# allocate
+def allocate(args, label):
+
+    client = buildClient(args)
+    first = client.lastCbteNro(args.ptoVta, args.cbteTipo) + 1
+
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=worker, args=(args, results)) for i in range(args.processes)]
+    for p in processes:
+        p.start()
+    details = [d for p in processes for d in results.get()]
+    for p in processes:
+        p.join()
+
+    # every receipt authorized, numbers consecutive from the service's last
+    total = args.processes * args.threads * args.batches * args.size
+    assert len(details) == total, (len(details), total)
+    rejected = [d for d in details if d[1] != "A"]
+    assert not rejected, rejected[:5]
+    numbers = sorted(n for n, r, cae in details)
+    assert numbers == list(range(first, first + total)), "gaps or duplicates"
+    last = client.lastCbteNro(args.ptoVta, args.cbteTipo)
+    assert last == numbers[-1], (last, numbers[-1])
+    assert client.numbers.read(args.ptoVta, args.cbteTipo) == last
+
+    # and each one is the receipt the service holds under that number
+    for cbteNro, resultado, cae in details:
+        response = client.fECompConsultar(args.ptoVta, args.cbteTipo, cbteNro)
+        assert response.ResultGet.CodAutorizacion == cae, (cbteNro, response)
+    print("%-8s %d..%d, %d receipts" % (label, first, last, total))
+
+
+# reject
+def reject(args, label, skew):
+
+    # the allocator out of step with the service: 10016, then a resync
+    client = buildClient(args)
+    last = client.lastCbteNro(args.ptoVta, args.cbteTipo)
+    client.numbers.update(args.ptoVta, args.cbteTipo, lambda n: (last + skew, None))
+
+    result = client.authorizeBatch(args.ptoVta, args.cbteTipo, [RECEIPT])[0]
+    assert result.Resultado == "R" and client.numbers.isNumberingError(result), result
+    assert client.lastCbteNro(args.ptoVta, args.cbteTipo) == last
+    assert client.numbers.read(args.ptoVta, args.cbteTipo) == last
+    print("%-8s %d rejected with 10016, resynced to %d" % (label, result.CbteDesde, last))
+
+
+if __name__ == "__main__":
+
+    # run from afipClient/ with the mock up: python benchmarks/numbering.py bsdu
+    parser = argparse.ArgumentParser()
+    parser.add_argument("type", nargs="?", default="bsdu")
+    parser.add_argument("--ptoVta", type=int, default=8)
+    parser.add_argument("--cbteTipo", type=int, default=1)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--batches", type=int, default=5)
+    parser.add_argument("--size", type=int, default=3)
+    parser.add_argument("--skip", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as dir:
+        args.dir = dir
+        allocate(args, "parallel")
+        reject(args, "ahead", args.skip)
+        allocate(args, "parallel")
+        reject(args, "behind", -args.skip)
+        allocate(args, "parallel")
@@ -0,0 +1,66 @@
+import sys
+sys.path.insert(0, '.')
+
+import argparse
+import time
+
+from OperationRegistry import *
+
+NAMES = (
+    "FECompUltimoAutorizado",
+    "FECAESolicitar",
+    "FECompConsultar",
+    "FEParamGet",
+    "FEDummy",
+)
+
+AUTH = {"Token": "token", "Sign": "sign", "Cuit": "20111111112"}
+
+
+# legacyBuildObject
+def legacyBuildObject(client, className):
+
+    # what AfipClient.buildObject did before the registry
+    module = __import__(className)
+    class_ = getattr(module, className)
+    obj = class_()
+    obj.setAuth(AUTH)
+    obj.setClient(client)
+    return obj
+
+
+# registryBuildObject
+def registryBuildObject(operations, className):
+    obj = operations.get(className)
+    obj.setAuth(AUTH)
+    return obj
+
+
+# measure
+def measure(name, fn, rounds):
+
+    start = time.perf_counter()
+    for i in range(rounds):
+        for className in NAMES:
+            fn(className)
+    elapsed = time.perf_counter() - start
+    print("%-10s %8.3f us/call" % (name, elapsed * 1e6 / (rounds * len(NAMES))))
+
+
+if __name__ == "__main__":
+
+    # run from afipClient/: python benchmarks/operations.py
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=20000)
+    args = parser.parse_args()
+
+    client = object()
+
+    start = time.perf_counter()
+    operations = OperationRegistry(client)
+    for className in NAMES:
+        operations.get(className)
+    print("startup    %8.3f ms (first use of %d operations)" % ((time.perf_counter() - start) * 1000, len(NAMES)))
+
+    measure("legacy", lambda className: legacyBuildObject(client, className), args.rounds)
+    measure("registry", lambda className: registryBuildObject(operations, className), args.rounds)
@@ -0,0 +1,104 @@
+import sys
+sys.path.insert(0, '.')
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+from AfipClient import *
+from benchmarks.fastpath import RECEIPT
+
+
+# buildClient
+def buildClient(args):
+
+    # the mock takes any ticket, no loginCms round trip
+    loginCms = LoginCms(proactive=False)
+    loginCms.ticket = Ticket("token", "sign", "20111111112", datetime.now(timezone.utc) + timedelta(hours=12))
+    client = AfipClient(args.type, loginCms=loginCms)
+    client.numbers = CbteNroAllocator(client.scope, client.lastCbteNro, dir=os.path.join(args.dir, "numbers"))
+    client.journal = CaeJournal(client.scope, dir=os.path.join(args.dir, "cae"), settle=0)
+    return client
+
+
+# crash
+def crash(args, sent, pipe):
+
+    # the process dies with the send journaled and nothing settled: after
+    # the service answered when sent, before the request left otherwise
+    client = buildClient(args)
+    send = client.sendChunk
+
+    def sendChunk(ptoVta, cbteTipo, chunk, cbteDesde):
+        caes = None
+        if sent:
+            response = send(ptoVta, cbteTipo, chunk, cbteDesde)
+            caes = [(d.CbteDesde, d.Resultado, d.CAE) for d in client.feDetResp(response)]
+        # a pipe, a queue would lose it to os._exit
+        pipe.send((cbteDesde, caes))
+        os._exit(1)
+
+    client.sendChunk = sendChunk
+    client.authorizeBatch(args.ptoVta, args.cbteTipo, [RECEIPT] * args.count)
+
+
+# scenario
+def scenario(args, sent):
+
+    reader, writer = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=crash, args=(args, sent, writer))
+    process.start()
+    process.join()
+    assert reader.poll(), "crashed before the send"
+    first, caes = reader.recv()
+    assert process.exitcode == 1, process.exitcode
+
+    client = buildClient(args)
+    last = client.lastCbteNro(args.ptoVta, args.cbteTipo)
+    recovered = client.recover()
+    assert client.lastCbteNro(args.ptoVta, args.cbteTipo) == last, "recover sent a receipt"
+    assert not client.journal.doubtful(), "still in doubt after recover"
+    assert len(recovered) == 1, recovered
+    ptoVta, cbteTipo, results = recovered[0]
+    assert (ptoVta, cbteTipo) == (args.ptoVta, args.cbteTipo)
+    numbers = list(range(first, first + args.count))
+
+    if sent:
+        # the CAEs are the ones the service gave the dead process
+        assert last == numbers[-1], (last, numbers)
+        got = [(r.CbteDesde, r.Resultado, r.CAE) for r in results]
+        assert got == caes, (got, caes)
+        for cbteNro, resultado, cae in caes:
+            response = client.fECompConsultar(args.ptoVta, args.cbteTipo, cbteNro)
+            assert response.ResultGet.CodAutorizacion == cae, (cbteNro, response)
+        expected = numbers[-1] + 1
+    else:
+        # never seen by the service, its numbers are handed back
+        assert last == first - 1, (last, first)
+        assert all(r is None for r in results), results
+        expected = first
+
+    # the next receipt gets the next free number and a CAE of its own
+    result = client.authorizeBatch(args.ptoVta, args.cbteTipo, [RECEIPT])[0]
+    assert result.Resultado == "A" and result.CbteDesde == expected, (result, expected)
+    assert caes is None or result.CAE not in [cae for n, r, cae in caes]
+    client.journal.close()
+    print("%-8s %d..%d recovered, next %d" % ("sent" if sent else "unsent", first, numbers[-1], expected))
+
+
+if __name__ == "__main__":
+
+    # run from afipClient/ with the mock up: python benchmarks/recovery.py bsdu
+    parser = argparse.ArgumentParser()
+    parser.add_argument("type", nargs="?", default="bsdu")
+    parser.add_argument("--ptoVta", type=int, default=7)
+    parser.add_argument("--cbteTipo", type=int, default=1)
+    parser.add_argument("--count", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as dir:
+        args.dir = dir
+        scenario(args, sent=True)
+        scenario(args, sent=False)
@@ -0,0 +1,104 @@
+import sys
+sys.path.insert(0, '.')
+
+import argparse
+import gc
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from lxml import etree
+from AfipClient import *
+
+
+# reply
+def reply(operation, start, count):
+
+    # a FECAESolicitar response as the service would send it
+    details = [
+        {
+            "Concepto": 1, "DocTipo": 80, "DocNro": 20111111112,
+            "CbteDesde": start + i, "CbteHasta": start + i, "CbteFch": "20210928",
+            "Resultado": "A", "CAE": "%014d" % (71234567890123 + start + i), "CAEFchVto": "20211008",
+        }
+        for i in range(count)
+    ]
+    result = {
+        "FeCabResp": {"Cuit": 20111111112, "PtoVta": 1, "CbteTipo": 1, "CantReg": count, "Resultado": "A"},
+        "FeDetResp": {"FECAEDetResponse": details},
+    }
+    message = operation.output.serialize(FECAESolicitarResult=result)
+    content = etree.tostring(message.content)
+    return SimpleNamespace(status_code=200, content=content, headers={}, encoding="utf-8")
+
+
+# measure
+def measure(name, client, replies, keep):
+
+    # keep(details) adds one response's details to what the caller retains
+    binding = client.wsfe.service._binding
+    operation = binding.get("FECAESolicitar")
+
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    retained = None
+    for r in replies:
+        response = binding.process_reply(client.wsfe, operation, r)
+        retained = keep(retained, client.feDetResp(response))
+        del response
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    count = len(retained)
+    print(
+        "%-8s retained %7.1f MB (%5d B/receipt)  peak %7.1f MB  %6.2f s"
+        % (name, current / 1e6, current / count, peak / 1e6, elapsed)
+    )
+    return retained
+
+
+# keepZeep
+def keepZeep(retained, details):
+    retained = retained if retained is not None else []
+    retained.extend(details)
+    return retained
+
+
+# keepSlots
+def keepSlots(retained, details):
+    retained = retained if retained is not None else []
+    retained.extend(compactDetail(detail) for detail in details)
+    return retained
+
+
+# keepColumns
+def keepColumns(retained, details):
+    retained = retained if retained is not None else CaeResults()
+    for detail in details:
+        retained.append(detail)
+    return retained
+
+
+if __name__ == "__main__":
+
+    # run from afipClient/ once the wsdl is cached: python benchmarks/results.py bsdu
+    parser = argparse.ArgumentParser()
+    parser.add_argument("type", nargs="?", default="bsdu")
+    parser.add_argument("--receipts", type=int, default=100000)
+    parser.add_argument("--batch", type=int, default=250)
+    args = parser.parse_args()
+
+    client = AfipClient(args.type)
+    operation = client.wsfe.service._binding.get("FECAESolicitar")
+    replies = [
+        reply(operation, start + 1, min(args.batch, args.receipts - start))
+        for start in range(0, args.receipts, args.batch)
+    ]
+
+    print("%d receipts in responses of %d" % (args.receipts, args.batch))
+    for name, keep in (("zeep", keepZeep), ("slots", keepSlots), ("columns", keepColumns)):
+        retained = measure(name, client, replies, keep)
+        del retained
@@ -0,0 +1,42 @@
+import sys
+sys.path.insert(0, '.')
+
+import argparse
+import time
+
+from LoginCms import *
+from CmsSigner import *
+
+
+# openssl
+def openssl(loginCms, s):
+    loginCms.writeRequest(s)
+    loginCms.buildRequestCms()
+    return loginCms.extractParam()
+
+
+# measure
+def measure(name, fn, rounds):
+
+    fn()
+    start = time.perf_counter()
+    for i in range(rounds):
+        fn()
+    elapsed = time.perf_counter() - start
+    print("%-12s %8.3f ms/signature" % (name, elapsed * 1000 / rounds))
+
+
+if __name__ == "__main__":
+
+    # run from afipClient/: python benchmarks/signing.py
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    loginCms = LoginCms()
+    loginCms.logger.info = lambda message: None
+    signer = CmsSigner()
+    s = loginCms.buildRequest()
+
+    measure("openssl", lambda: openssl(loginCms, s), args.rounds)
+    measure("in-process", lambda: signer.sign(s), args.rounds)
@@ -1,39 +1,315 @@
+import argparse
+import itertools
+import json
+import sys
+from decimal import Decimal
+from types import SimpleNamespace
+
+from zeep.helpers import serialize_object
+
+import Logger as logs
 from AfipClient import *
-	
-afipClient = AfipClient('afip')
-afipClient.fEDummy()
-afipClient.fECompUltimoAutorizado()
-# afipClient.fECAESolicitar()
-# afipClient.fECAEASolicitar()
-# afipClient.fECompConsultar()
-# afipClient.fECAEAConsultar()
-# afipClient.fECAEASinMovimientoInformar()
-# afipClient.fECAEASinMovimientoConsultar()
-
-# bsduAfipClient = AfipClient('bsdu')
-# bsduAfipClient.fEDummy()
-# bsduAfipClient.fECompUltimoAutorizado()
-# bsduAfipClient.fECAESolicitar()
-# bsduAfipClient.fECAEASolicitar()
-# bsduAfipClient.fECompConsultar()
-# bsduAfipClient.fECAEAConsultar()
-# bsduAfipClient.fECAEASinMovimientoInformar()
-# bsduAfipClient.fECAEASinMovimientoConsultar()
-
-# afipClient.fECAEASolicitar()
-# afipClient.fECompConsultar()
-# afipClient.fECAEAConsultar()
-# afipClient.fECAEASinMovimientoInformar()
-# afipClient.fECAEASinMovimientoConsultar()
-
-# afipClient.fEParamGet("FEParamGetCotizacion")
-# afipClient.fEParamGet("FEParamGetPtosVenta")
-# afipClient.fEParamGet("FEParamGetTiposCbte")
-# afipClient.fEParamGet("FEParamGetTiposConcepto")
-# afipClient.fEParamGet("FEParamGetTiposDoc")
-# afipClient.fEParamGet("FEParamGetTiposIva")
-# afipClient.fEParamGet("FEParamGetTiposMonedas")
-# afipClient.fEParamGet("FEParamGetTiposOpcional")
-# afipClient.fEParamGet("FEParamGetTiposPaises")
-# afipClient.fEParamGet("FEParamGetTiposTributos")
-# afipClient.fEParamGet("FECompTotXRequest")
+from CaeaDrainer import *
+from CaeaJournal import *
+from Reconciler import *
+
+# keys of an input line that address the receipt instead of describing it
+ADDRESS_KEYS = ("PtoVta", "CbteTipo", "CbteNro", "CAEA")
+
+
+# plain
+def plain(obj):
+
+    # zeep objects, fast path namespaces and compact results as json values
+    obj = serialize_object(obj)
+    if isinstance(obj, SimpleNamespace):
+        obj = vars(obj)
+    elif hasattr(obj, "__slots__"):
+        obj = {name: getattr(obj, name) for name in obj.__slots__}
+    if isinstance(obj, dict):
+        return {key: plain(value) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [plain(value) for value in obj]
+    return obj
+
+
+# emit
+def emit(obj):
+    sys.stdout.write(json.dumps(plain(obj), default=str) + "\n")
+
+
+# readLines
+def readLines(file):
+
+    # one receipt per line, amounts as Decimal so nothing is rounded
+    f = sys.stdin if file in (None, "-") else open(file)
+    for number, line in enumerate(f, 1):
+        line = line.strip()
+        if line:
+            yield number, json.loads(line, parse_float=Decimal)
+    if f is not sys.stdin:
+        f.close()
+
+
+# receiptOf
+def receiptOf(record):
+    return {key: value for key, value in record.items() if key not in ADDRESS_KEYS}
+
+
+# emitRecovered
+def emitRecovered(recovered):
+    for ptoVta, cbteTipo, results in recovered:
+        for detail in results:
+            if detail is not None:
+                emit(dict(plain(detail), recovered=True, PtoVta=ptoVta, CbteTipo=cbteTipo))
+
+
+# emitGroup
+def emitGroup(client, ptoVta, cbteTipo, items):
+
+    error = None
+    try:
+        details = client.fECAESolicitarBatch(ptoVta, cbteTipo, [r for n, r in items])
+    except BatchError as e:
+        # chunks answered before the error keep their CAEs
+        error, details = e.error, e.results
+    except Exception as e:
+        error, details = e, [None] * len(items)
+    if error is not None:
+        client.logger.error("Batch %d-%d failed: %s", ptoVta, cbteTipo, error)
+
+    for (number, receipt), detail in zip(items, details):
+        result = {"line": number, "PtoVta": ptoVta, "CbteTipo": cbteTipo}
+        if detail is None and error is not None:
+            # not sent because of the error
+            result["error"] = str(error)
+        elif detail is None:
+            # not sent after an earlier rejection, numbers were released
+            result["Resultado"] = None
+        else:
+            result.update(plain(detail))
+            if detail.Resultado == IN_DOUBT:
+                # sent without an answer, resolved by recover
+                result["error"] = str(error)
+        emit(result)
+
+
+# authorize
+def authorize(client, args):
+
+    if args.validate or args.autoCorrect:
+        client.validator = ReceiptValidator(autoCorrect=args.autoCorrect)
+
+    # sends left in doubt by an earlier run are settled before numbering
+    if args.journal:
+        client.journal = CaeJournal(client.scope)
+
+    try:
+        if client.journal is not None:
+            emitRecovered(client.recover())
+
+        # a chunk of lines at a time, memory stays bounded whatever the input size
+        lines = readLines(args.file)
+        while True:
+            chunk = list(itertools.islice(lines, args.chunk))
+            if not chunk:
+                break
+
+            # batches per point of sale and type, each emitted as soon as it
+            # returns; a group that fails does not stop the others
+            groups = {}
+            for number, record in chunk:
+                ptoVta = int(record.get("PtoVta", args.ptoVta))
+                cbteTipo = int(record.get("CbteTipo", args.cbteTipo))
+                groups.setdefault((ptoVta, cbteTipo), []).append((number, receiptOf(record)))
+
+            for (ptoVta, cbteTipo), items in groups.items():
+                emitGroup(client, ptoVta, cbteTipo, items)
+                sys.stdout.flush()
+    finally:
+        if client.journal is not None:
+            client.journal.close()
+
+
+# recover
+def recover(client, args):
+
+    with CaeJournal(client.scope, settle=args.settle) as journal:
+        client.journal = journal
+        emitRecovered(client.recover(args.concurrency))
+
+
+# params
+def params(client, args):
+    for param in args.names or PARAM_TABLES + ("FECompTotXRequest",):
+        emit({"param": param, "result": client.fEParamGet(param)})
+
+
+# lastAuthorized
+def lastAuthorized(client, args):
+    response = client.fECompUltimoAutorizado(args.ptoVta, args.cbteTipo)
+    emit({"PtoVta": args.ptoVta, "CbteTipo": args.cbteTipo, "CbteNro": response.CbteNro})
+
+
+# consult
+def consult(client, args):
+    for cbteNro in range(args.number, (args.to or args.number) + 1):
+        response = client.fECompConsultar(args.ptoVta, args.cbteTipo, cbteNro)
+        emit({"CbteNro": cbteNro, "ResultGet": response.ResultGet, "Errors": response.Errors})
+        sys.stdout.flush()
+
+
+# reconcile
+def reconcile(client, args):
+
+    local = {}
+    for number, record in readLines(args.local):
+        key = (int(record["PtoVta"]), int(record["CbteTipo"]), int(record["CbteNro"]))
+        local[key] = record
+
+    reconciler = Reconciler(
+        client,
+        lambda ptoVta, cbteTipo, cbteNro: local.get((ptoVta, cbteTipo, cbteNro)),
+        checkpoint=args.checkpoint,
+        concurrency=args.concurrency,
+    )
+    span = (args.ptoVta, args.cbteTipo, args.number, args.to or args.number)
+    for difference in reconciler.run([span]):
+        emit(vars(difference))
+        sys.stdout.flush()
+
+
+# caea
+def caea(client, args):
+
+    if args.action == "request":
+        emit(client.fECAEASolicitar(args.periodo, args.orden))
+    elif args.action == "consult":
+        emit(client.fECAEAConsultar(args.periodo, args.orden))
+    elif args.action in ("rejected", "acknowledge"):
+        # rejected receipts stay in the journal until acknowledged
+        with CaeaJournal(client.type) as journal:
+            if args.action == "acknowledge":
+                keys = [
+                    (int(record["PtoVta"]), int(record["CbteTipo"]), int(record["CbteNro"]))
+                    for number, record in readLines(args.file)
+                ]
+                emit({"acknowledged": journal.acknowledge(keys)})
+            else:
+                for entry in journal.rejected():
+                    emit(entry)
+    else:
+        # receipts issued with a CAEA are journaled first, then informed
+        with CaeaJournal(client.type) as journal:
+            keys = []
+            if args.action == "inform":
+                for number, record in readLines(args.file):
+                    key = (int(record["PtoVta"]), int(record["CbteTipo"]), int(record["CbteNro"]))
+                    journal.append(*key, record["CAEA"], receiptOf(record))
+                    keys.append(key)
+            else:
+                keys = [
+                    (entry["ptoVta"], entry["cbteTipo"], entry["cbteNro"])
+                    for entries in journal.pending().values()
+                    for entry in entries
+                ]
+
+            try:
+                CaeaDrainer(client, journal).drain()
+            except Exception as e:
+                # what was not informed stays pending for the next drain
+                emit({"error": str(e)})
+            for key in keys:
+                entry = journal.get(*key)
+                ptoVta, cbteTipo, cbteNro = key
+                result = entry.get("resultado")
+                emit({"PtoVta": ptoVta, "CbteTipo": cbteTipo, "CbteNro": cbteNro, "Resultado": result})
+
+
+# parser
+def parser():
+
+    parser = argparse.ArgumentParser(description="AFIP electronic invoicing client")
+    parser.add_argument("--type", default="afip", help="afip (homologation) or bsdu (mock)")
+    parser.add_argument("--fast", action="store_true", help="pre-rendered xml for hot operations")
+    parser.add_argument(
+        "--log-level", default="INFO", choices=("DEBUG", "INFO", "WARNING", "ERROR")
+    )
+    parser.add_argument("--json-logs", action="store_true")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def addReceipt(command, number=False):
+        command.add_argument("--pto-vta", dest="ptoVta", type=int, default=1)
+        command.add_argument("--cbte-tipo", dest="cbteTipo", type=int, default=1)
+        if number:
+            command.add_argument("--number", type=int, required=True)
+            command.add_argument("--to", type=int, help="last number of the range")
+
+    command = commands.add_parser("authorize", help="authorize JSONL receipts, FECAESolicitar")
+    command.add_argument("file", nargs="?", help="JSONL receipts, stdin when missing")
+    command.add_argument("--chunk", type=int, default=1000, help="lines read at a time")
+    command.add_argument("--validate", action="store_true", help="reject invalid receipts locally")
+    command.add_argument(
+        "--auto-correct",
+        dest="autoCorrect",
+        action="store_true",
+        help="recompute VAT amounts and totals before validating",
+    )
+    command.add_argument(
+        "--no-journal",
+        dest="journal",
+        action="store_false",
+        help="no write-ahead log, sends cut short need a reconcile",
+    )
+    addReceipt(command)
+    command.set_defaults(run=authorize)
+
+    command = commands.add_parser("recover", help="resolve sends left in doubt by a crash")
+    command.add_argument(
+        "--settle", type=float, default=60, help="seconds a send may still be processing"
+    )
+    command.add_argument("--concurrency", type=int, default=8)
+    command.set_defaults(run=recover)
+
+    command = commands.add_parser("params", help="FEParamGet tables")
+    command.add_argument("names", nargs="*")
+    command.set_defaults(run=params)
+
+    command = commands.add_parser("last-authorized", help="FECompUltimoAutorizado")
+    addReceipt(command)
+    command.set_defaults(run=lastAuthorized)
+
+    command = commands.add_parser("consult", help="FECompConsultar for a number or a range")
+    addReceipt(command, number=True)
+    command.set_defaults(run=consult)
+
+    command = commands.add_parser("reconcile", help="compare a range with local JSONL receipts")
+    command.add_argument("local", help="JSONL with PtoVta, CbteTipo, CbteNro, ImpTotal and CAE")
+    command.add_argument("--checkpoint", help="resume file")
+    command.add_argument("--concurrency", type=int, default=8)
+    addReceipt(command, number=True)
+    command.set_defaults(run=reconcile)
+
+    command = commands.add_parser("caea", help="CAEA request, consult and informing")
+    command.add_argument(
+        "action", choices=("request", "consult", "inform", "drain", "rejected", "acknowledge")
+    )
+    command.add_argument(
+        "file", nargs="?", help="JSONL receipts to inform or acknowledge, stdin when missing"
+    )
+    command.add_argument("--periodo", default="202109")
+    command.add_argument("--orden", type=int, default=1)
+    command.set_defaults(run=caea)
+
+    return parser
+
+
+if __name__ == "__main__":
+
+    args = parser().parse_args()
+
+    # stdout carries the results, logs go to stderr
+    logs.configure(getattr(logs, args.log_level), args.json_logs, stream=sys.stderr)
+
+    client = AfipClient(args.type, fastPath=args.fast)
+    args.run(client, args)
@@ -0,0 +1,24 @@
+from lxml import etree
+from spyne.protocol.soap import Soap11
+
+# AfipSoap11
+class AfipSoap11(Soap11):
+
+	# responses as AFIP writes them: the service namespace is the default one
+	# and its elements carry no prefix, other namespaces keep theirs. Done on
+	# the document, so the rendered string goes to the WSGI response as is
+
+	# serialize
+	def serialize(self, ctx, message):
+
+		super(AfipSoap11, self).serialize(ctx, message)
+
+		# nodes moved under an envelope declaring tns as default take it over
+		tns = self.app.interface.get_tns()
+		nsmap = dict((prefix, ns) for prefix, ns in self.app.interface.nsmap.items() if ns != tns and prefix is not None)
+		nsmap[None] = tns
+		envelope = etree.Element(ctx.out_document.tag, nsmap=nsmap)
+		for child in list(ctx.out_document):
+			envelope.append(child)
+		etree.cleanup_namespaces(envelope)
+		ctx.out_document = envelope
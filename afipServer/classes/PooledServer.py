@@ -0,0 +1,267 @@
+import os
+import selectors
+import signal
+import socket
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.simple_server import ServerHandler, WSGIRequestHandler, WSGIServer
+
+from ServerLog import accessLogger, sampled
+
+# Connection
+class Connection:
+
+	# __init__
+	def __init__(self, sock, address):
+		self.sock = sock
+		self.address = address
+		self.rfile = sock.makefile('rb', -1)
+		self.wfile = sock.makefile('wb', 0)
+		self.lastUsed = time.monotonic()
+
+	# close
+	def close(self):
+		for f in (self.rfile, self.wfile):
+			try:
+				f.close()
+			except OSError:
+				None
+		try:
+			self.sock.shutdown(socket.SHUT_RDWR)
+		except OSError:
+			None
+		self.sock.close()
+
+# KeepAliveServerHandler
+class KeepAliveServerHandler(ServerHandler):
+
+	http_version = '1.1'
+
+	# finish_response
+	def finish_response(self):
+
+		# the body as one chunk, its length is known and the connection can stay open
+		if 'Content-Length' not in self.headers and not self.result_is_file():
+			result = self.result
+			try:
+				self.result = [b''.join(result)]
+			finally:
+				if hasattr(result, 'close'):
+					result.close()
+		super().finish_response()
+
+	# cleanup_headers
+	def cleanup_headers(self):
+		super().cleanup_headers()
+		if 'Content-Length' not in self.headers or self.request_handler.close_connection:
+			self.request_handler.close_connection = True
+			self.headers['Connection'] = 'close'
+
+# LoggedRequestHandler
+class LoggedRequestHandler(WSGIRequestHandler):
+
+	# log_request
+	def log_request(self, code='-', size='-'):
+		# a sample of the requests, every failure
+		if sampled() or str(code)[:1] in ('4', '5'):
+			self.log_message('"%s" %s %s', self.requestline, str(code), str(size))
+
+	# log_message
+	def log_message(self, format, *args):
+		accessLogger.info('%s ' + format, self.address_string(), *args)
+
+# KeepAliveHandler
+class KeepAliveHandler(LoggedRequestHandler):
+
+	# one request of a connection, the connection outlives the handler
+	protocol_version = 'HTTP/1.1'
+
+	# setup
+	def setup(self):
+		self.connection = self.request.sock
+		self.rfile = self.request.rfile
+		self.wfile = self.request.wfile
+
+	# finish
+	def finish(self):
+		None
+
+	# handle
+	def handle(self):
+
+		self.close_connection = True
+		try:
+			self.raw_requestline = self.rfile.readline(65537)
+		except (socket.timeout, OSError):
+			return
+		if not self.raw_requestline:
+			return
+		if len(self.raw_requestline) > 65536:
+			self.requestline = ''
+			self.request_version = ''
+			self.command = ''
+			self.send_error(414)
+			return
+
+		if not self.parse_request():
+			return
+
+		# only HTTP/1.1 clients keep the connection, 1.0 ones would need the header echoed
+		if self.request_version != 'HTTP/1.1':
+			self.close_connection = True
+
+		handler = KeepAliveServerHandler(
+			self.rfile, self.wfile, self.get_stderr(), self.get_environ(),
+			multithread=self.server.multithread, multiprocess=self.server.multiprocess,
+		)
+		handler.request_handler = self
+		handler.run(self.server.get_app())
+
+# PooledWSGIServer
+class PooledWSGIServer(WSGIServer):
+
+	# requests run on a pool of worker threads; idle keep-alive connections
+	# wait in a selector, not on a worker, so a few workers serve many clients
+	multithread = True
+	multiprocess = False
+
+	# __init__
+	def __init__(self, address, threads=8, keepAlive=15, timeout=30):
+		super().__init__(address, KeepAliveHandler)
+		self.threads = threads
+		self.keepAlive = keepAlive
+		self.requestTimeout = timeout
+		self.executor = None
+		self._returned = deque()
+		self._stop = False
+		self._wakeRead = None
+		self._wakeWrite = None
+
+	# serve_forever
+	def serve_forever(self, poll_interval=1):
+
+		# workers and the wake-up pair are made here, after any fork
+		self.executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='worker')
+		self._wakeRead, self._wakeWrite = socket.socketpair()
+		self._wakeRead.setblocking(False)
+		self._wakeWrite.setblocking(False)
+		self.socket.setblocking(False)
+
+		selector = selectors.DefaultSelector()
+		selector.register(self.socket, selectors.EVENT_READ, 'accept')
+		selector.register(self._wakeRead, selectors.EVENT_READ, 'wake')
+		idle = {}
+
+		try:
+			while not self._stop:
+				for key, events in selector.select(poll_interval):
+					if key.data == 'accept':
+						self.accept(selector, idle)
+					elif key.data == 'wake':
+						try:
+							self._wakeRead.recv(4096)
+						except BlockingIOError:
+							None
+					else:
+						# a request arrived, hand the connection to a worker
+						selector.unregister(key.fileobj)
+						del idle[key.fileobj]
+						self.executor.submit(self.serve, key.data)
+
+				# connections back from the workers wait for their next request
+				while self._returned:
+					connection = self._returned.popleft()
+					selector.register(connection.sock, selectors.EVENT_READ, connection)
+					idle[connection.sock] = connection
+
+				limit = time.monotonic() - self.keepAlive
+				for sock, connection in list(idle.items()):
+					if connection.lastUsed < limit:
+						selector.unregister(sock)
+						del idle[sock]
+						connection.close()
+		finally:
+			for connection in idle.values():
+				connection.close()
+			selector.close()
+			self.executor.shutdown(wait=True)
+
+	# accept
+	def accept(self, selector, idle):
+
+		# other processes share the socket, whoever is first takes the client
+		while True:
+			try:
+				sock, address = self.socket.accept()
+			except (BlockingIOError, InterruptedError):
+				return
+			sock.setblocking(True)
+			sock.settimeout(self.requestTimeout)
+			sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+			connection = Connection(sock, address)
+			selector.register(sock, selectors.EVENT_READ, connection)
+			idle[sock] = connection
+
+	# serve
+	def serve(self, connection):
+
+		try:
+			handler = KeepAliveHandler(connection, connection.address, self)
+			keep = not handler.close_connection
+		except Exception:
+			self.handle_error(connection.sock, connection.address)
+			keep = False
+
+		if not keep:
+			connection.close()
+			return
+		connection.lastUsed = time.monotonic()
+		self._returned.append(connection)
+		self.wake()
+
+	# wake
+	def wake(self):
+		if self._wakeWrite is None:
+			return
+		try:
+			self._wakeWrite.send(b'\0')
+		except (BlockingIOError, OSError):
+			None
+
+	# shutdown
+	def shutdown(self):
+		self._stop = True
+		self.wake()
+
+# prefork
+def prefork(server, processes):
+
+	# the listening socket is bound once and shared by every worker process;
+	# each one serves it with its own thread pool
+	server.multiprocess = processes > 1
+	children = []
+	for i in range(processes - 1):
+		pid = os.fork()
+		if pid == 0:
+			signal.signal(signal.SIGTERM, lambda signum, frame: server.shutdown())
+			try:
+				server.serve_forever()
+			finally:
+				os._exit(0)
+		children.append(pid)
+
+	def stop(signum, frame):
+		server.shutdown()
+
+	signal.signal(signal.SIGTERM, stop)
+	try:
+		server.serve_forever()
+	finally:
+		for pid in children:
+			try:
+				os.kill(pid, signal.SIGTERM)
+			except ProcessLookupError:
+				None
+		for pid in children:
+			os.waitpid(pid, 0)
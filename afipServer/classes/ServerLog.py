@@ -0,0 +1,211 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+from lxml import etree
+
+PERFORMANCE = 'performance'
+DEBUG = 'debug'
+
+# envelopes longer than this are cut, the tail says how much was dropped
+MAX_ENVELOPE = 2048
+
+logger = logging.getLogger('afipServer')
+accessLogger = logging.getLogger('afipServer.access')
+envelopeLogger = logging.getLogger('afipServer.envelope')
+
+_handler = None
+_listener = None
+_sampleRate = 0.0
+_maxEnvelope = MAX_ENVELOPE
+_forkHook = False
+
+# TokenBucket
+class TokenBucket:
+
+	# __init__
+	def __init__(self, perSecond):
+		self.perSecond = perSecond
+		self.tokens = perSecond
+		self.refilled = time.monotonic()
+
+	# take
+	def take(self):
+		now = time.monotonic()
+		self.tokens = min(self.perSecond, self.tokens + (now - self.refilled) * self.perSecond)
+		self.refilled = now
+		if self.tokens < 1:
+			return False
+		self.tokens -= 1
+		return True
+
+# RateLimitedQueueHandler
+class RateLimitedQueueHandler(logging.handlers.QueueHandler):
+
+	# records go to a bounded queue drained by a writer thread, past maxPerSecond
+	# or with the queue full they are dropped and counted instead of blocking a
+	# request; warnings and errors have a budget of their own
+
+	# __init__
+	def __init__(self, maxPerSecond=200, maxQueue=10000):
+		super().__init__(queue.Queue(maxQueue))
+		self.maxPerSecond = maxPerSecond
+		self.dropped = 0
+		self._info = TokenBucket(maxPerSecond)
+		self._warnings = TokenBucket(maxPerSecond)
+		self._lock = threading.Lock()
+
+	# allow
+	def allow(self, record):
+		bucket = self._warnings if record.levelno >= logging.WARNING else self._info
+		with self._lock:
+			if bucket.take():
+				return True
+			self.dropped += 1
+			return False
+
+	# prepare
+	def prepare(self, record):
+		# formatted by the writer thread, not by the request
+		return record
+
+	# emit
+	def emit(self, record):
+
+		if not self.allow(record):
+			return
+		try:
+			self.queue.put_nowait(record)
+		except queue.Full:
+			with self._lock:
+				self.dropped += 1
+
+	# takeDropped
+	def takeDropped(self):
+		with self._lock:
+			dropped, self.dropped = self.dropped, 0
+		return dropped
+
+# DroppedReporter
+class DroppedReporter(logging.Handler):
+
+	# the writer side: tells once per interval how many records were dropped
+
+	# __init__
+	def __init__(self, target, source, interval=10):
+		super().__init__()
+		self.target = target
+		self.source = source
+		self.interval = interval
+		self._reported = time.monotonic()
+
+	# emit
+	def emit(self, record):
+
+		self.target.handle(record)
+		now = time.monotonic()
+		if now - self._reported >= self.interval:
+			self._reported = now
+			dropped = self.source.takeDropped()
+			if dropped:
+				self.target.handle(logger.makeRecord(
+					logger.name, logging.WARNING, __file__, 0,
+					'%d log records dropped by the rate limit', (dropped,), None,
+				))
+
+# sampled
+def sampled():
+	return _sampleRate > 0 and random.random() < _sampleRate
+
+# cut
+def cut(data):
+
+	if data is None:
+		return ''
+	if not isinstance(data, (str, bytes)):
+		data = b''.join(d if isinstance(d, bytes) else d.encode('utf-8') for d in data)
+	if isinstance(data, bytes):
+		data = data.decode('utf-8', 'replace')
+	if len(data) > _maxEnvelope:
+		return '%s...[%d more chars]' % (data[:_maxEnvelope], len(data) - _maxEnvelope)
+	return data
+
+# onReturn
+def onReturn(ctx):
+
+	# a sample of the requests get their envelopes logged, capped
+	if not sampled() or not envelopeLogger.isEnabledFor(logging.INFO):
+		return
+	# the request stream is consumed by now, its parsed document is not
+	request = etree.tostring(ctx.in_document) if ctx.in_document is not None else None
+	envelopeLogger.info('%s request %s', ctx.method_request_string, cut(request))
+	envelopeLogger.info('%s response %s', ctx.method_request_string, cut(ctx.out_string))
+
+# onException
+def onException(ctx):
+	logger.warning('%s failed: %s', ctx.method_request_string, ctx.out_error)
+
+# listen
+def listen(application):
+
+	# envelope sampling only in performance mode, debug logs them all already
+	if _listener is None:
+		return
+	application.event_manager.add_listener('method_return_string', onReturn)
+	application.event_manager.add_listener('method_exception_object', onException)
+
+# restart
+def restart():
+
+	# the writer thread does not survive a fork, each worker process gets its own
+	global _listener
+	if _handler is None:
+		return
+	_handler.queue = queue.Queue(_handler.queue.maxsize)
+	_listener = logging.handlers.QueueListener(_handler.queue, *_listener.handlers)
+	_listener.start()
+
+# configure
+def configure(mode=PERFORMANCE, sampleRate=0.01, maxEnvelope=MAX_ENVELOPE, maxPerSecond=200, stream=None):
+
+	global _handler, _listener, _sampleRate, _maxEnvelope, _forkHook
+
+	# debug: every envelope pretty-printed by spyne, synchronously, opt-in only
+	if mode == DEBUG:
+		_sampleRate = 1.0
+		logging.basicConfig(level=logging.DEBUG)
+		logging.getLogger('spyne.protocol.xml').setLevel(logging.DEBUG)
+		return
+
+	_sampleRate = sampleRate
+	_maxEnvelope = maxEnvelope
+
+	writer = logging.StreamHandler(stream or sys.stderr)
+	writer.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s %(message)s'))
+
+	_handler = RateLimitedQueueHandler(maxPerSecond)
+	_listener = logging.handlers.QueueListener(_handler.queue, DroppedReporter(writer, _handler))
+	_listener.start()
+
+	root = logging.getLogger()
+	root.handlers[:] = [_handler]
+	root.setLevel(logging.INFO)
+	# spyne checks this level itself before pretty-printing every envelope
+	logging.getLogger('spyne').setLevel(logging.WARNING)
+	logging.getLogger('spyne.protocol.xml').setLevel(logging.WARNING)
+
+	atexit.register(shutdown)
+	if not _forkHook:
+		os.register_at_fork(after_in_child=restart)
+		_forkHook = True
+
+# shutdown
+def shutdown():
+	if _listener is not None:
+		_listener.stop()
@@ -0,0 +1,292 @@
+import abc
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+
+# Store
+class Store(abc.ABC):
+
+	# where the mock keeps receipts, numbering and CAEA state; every write of
+	# a point of sale and type goes through transaction()
+
+	# transaction
+	@abc.abstractmethod
+	def transaction(self, ptoVta, cbteTipo):
+		None
+
+	# lastCbteNro
+	@abc.abstractmethod
+	def lastCbteNro(self, ptoVta, cbteTipo):
+		None
+
+	# receipt
+	@abc.abstractmethod
+	def receipt(self, ptoVta, cbteTipo, cbteNro):
+		None
+
+	# receiptByCae
+	@abc.abstractmethod
+	def receiptByCae(self, cae):
+		None
+
+	# setdefault
+	@abc.abstractmethod
+	def setdefault(self, kind, key, value):
+		# stores value unless key already has one, returns the stored value;
+		# workers asking at once all get the first
+		None
+
+	# get
+	@abc.abstractmethod
+	def get(self, kind, key):
+		None
+
+# Sequence
+class Sequence:
+
+	# one transaction of a point of sale and type: last is the last authorized
+	# number, receipts added here are stored together on commit
+
+	# __init__
+	def __init__(self, ptoVta, cbteTipo, last):
+		self.ptoVta = ptoVta
+		self.cbteTipo = cbteTipo
+		self.last = last
+		self.added = []
+
+	# add
+	def add(self, cbteNro, cae, caeFchVto, emisionTipo='CAE', resultado='A', processed=None, data=None):
+
+		# numbers only go forward, the service authorizes them in order
+		if cbteNro != self.last + 1:
+			raise ValueError('%d-%d: %d does not follow %d' % (self.ptoVta, self.cbteTipo, cbteNro, self.last))
+		receipt = {
+			'ptoVta': self.ptoVta,
+			'cbteTipo': self.cbteTipo,
+			'cbteNro': cbteNro,
+			'cae': str(cae),
+			'caeFchVto': caeFchVto,
+			'emisionTipo': emisionTipo,
+			'resultado': resultado,
+			'processed': processed,
+			'data': data,
+		}
+		self.added.append(receipt)
+		self.last = cbteNro
+		return receipt
+
+# MemoryStore
+class MemoryStore(Store):
+
+	# state of this process only, gone on restart
+
+	# __init__
+	def __init__(self):
+		self._receipts = {}
+		self._caes = {}
+		self._last = {}
+		self._entries = {}
+		self._locks = {}
+		self._lock = threading.Lock()
+
+	# lock
+	def lock(self, ptoVta, cbteTipo):
+		with self._lock:
+			return self._locks.setdefault((ptoVta, cbteTipo), threading.Lock())
+
+	# transaction
+	@contextlib.contextmanager
+	def transaction(self, ptoVta, cbteTipo):
+
+		with self.lock(ptoVta, cbteTipo):
+			sequence = Sequence(ptoVta, cbteTipo, self.lastCbteNro(ptoVta, cbteTipo))
+			yield sequence
+			for receipt in sequence.added:
+				self._receipts[(ptoVta, cbteTipo, receipt['cbteNro'])] = receipt
+				self._caes[receipt['cae']] = receipt
+			self._last[(ptoVta, cbteTipo)] = sequence.last
+
+	# lastCbteNro
+	def lastCbteNro(self, ptoVta, cbteTipo):
+		return self._last.get((ptoVta, cbteTipo), 0)
+
+	# receipt
+	def receipt(self, ptoVta, cbteTipo, cbteNro):
+		return self._receipts.get((ptoVta, cbteTipo, cbteNro))
+
+	# receiptByCae
+	def receiptByCae(self, cae):
+		return self._caes.get(str(cae))
+
+	# setdefault
+	def setdefault(self, kind, key, value):
+		with self._lock:
+			return self._entries.setdefault((kind, str(key)), value)
+
+	# get
+	def get(self, kind, key):
+		return self._entries.get((kind, str(key)))
+
+SCHEMA = '''
+create table if not exists receipts (
+	ptoVta integer not null,
+	cbteTipo integer not null,
+	cbteNro integer not null,
+	cae text not null,
+	caeFchVto text,
+	emisionTipo text,
+	resultado text,
+	processed text,
+	data text,
+	primary key (ptoVta, cbteTipo, cbteNro)
+) without rowid;
+create index if not exists receipts_cae on receipts (cae);
+create table if not exists sequences (
+	ptoVta integer not null,
+	cbteTipo integer not null,
+	last integer not null,
+	primary key (ptoVta, cbteTipo)
+) without rowid;
+create table if not exists entries (
+	kind text not null,
+	key text not null,
+	value text,
+	primary key (kind, key)
+) without rowid;
+'''
+
+COLUMNS = ('ptoVta', 'cbteTipo', 'cbteNro', 'cae', 'caeFchVto', 'emisionTipo', 'resultado', 'processed', 'data')
+
+# SqliteStore
+class SqliteStore(Store):
+
+	# one database file shared by every thread and worker process: WAL lets
+	# readers go on while one writer commits, receipts are clustered on
+	# (ptoVta, cbteTipo, cbteNro) and indexed on CAE
+
+	# __init__
+	def __init__(self, file, timeout=30):
+		self.file = file
+		self.timeout = timeout
+		self._local = threading.local()
+		self._locks = {}
+		self._lock = threading.Lock()
+
+		dir = os.path.dirname(file)
+		if dir:
+			os.makedirs(dir, exist_ok=True)
+		self.connection().executescript(SCHEMA)
+
+	# connection
+	def connection(self):
+
+		# one per thread, and a new one after a fork
+		local = self._local
+		if getattr(local, 'pid', None) != os.getpid():
+			local.connection = sqlite3.connect(self.file, timeout=self.timeout, isolation_level=None)
+			local.connection.execute('pragma journal_mode=wal')
+			local.connection.execute('pragma synchronous=normal')
+			local.pid = os.getpid()
+		return local.connection
+
+	# lock
+	def lock(self, ptoVta, cbteTipo):
+		with self._lock:
+			return self._locks.setdefault((ptoVta, cbteTipo), threading.Lock())
+
+	# transaction
+	@contextlib.contextmanager
+	def transaction(self, ptoVta, cbteTipo):
+
+		# threads of this process queue on the point of sale, other processes
+		# on the write lock taken by begin immediate
+		with self.lock(ptoVta, cbteTipo):
+			db = self.connection()
+			db.execute('begin immediate')
+			try:
+				sequence = Sequence(ptoVta, cbteTipo, self.lastCbteNro(ptoVta, cbteTipo))
+				yield sequence
+				if sequence.added:
+					db.executemany(
+						'insert into receipts values (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+						[tuple(self.encode(r)[c] for c in COLUMNS) for r in sequence.added],
+					)
+					db.execute(
+						'insert into sequences values (?, ?, ?) '
+						'on conflict (ptoVta, cbteTipo) do update set last = excluded.last',
+						(ptoVta, cbteTipo, sequence.last),
+					)
+				db.execute('commit')
+			except BaseException:
+				db.execute('rollback')
+				raise
+
+	# encode
+	def encode(self, receipt):
+		if receipt['data'] is None:
+			return receipt
+		return dict(receipt, data=json.dumps(receipt['data'], default=str))
+
+	# decode
+	def decode(self, row):
+		if row is None:
+			return None
+		receipt = dict(zip(COLUMNS, row))
+		if receipt['data'] is not None:
+			receipt['data'] = json.loads(receipt['data'])
+		return receipt
+
+	# lastCbteNro
+	def lastCbteNro(self, ptoVta, cbteTipo):
+		row = self.connection().execute(
+			'select last from sequences where ptoVta = ? and cbteTipo = ?', (ptoVta, cbteTipo)
+		).fetchone()
+		return row[0] if row else 0
+
+	# receipt
+	def receipt(self, ptoVta, cbteTipo, cbteNro):
+		return self.decode(self.connection().execute(
+			'select * from receipts where ptoVta = ? and cbteTipo = ? and cbteNro = ?',
+			(ptoVta, cbteTipo, cbteNro),
+		).fetchone())
+
+	# receiptByCae
+	def receiptByCae(self, cae):
+		return self.decode(self.connection().execute(
+			'select * from receipts where cae = ?', (str(cae),)
+		).fetchone())
+
+	# setdefault
+	def setdefault(self, kind, key, value):
+		self.connection().execute(
+			'insert into entries values (?, ?, ?) on conflict (kind, key) do nothing',
+			(kind, str(key), json.dumps(value, default=str)),
+		)
+		return self.get(kind, key)
+
+	# get
+	def get(self, kind, key):
+		row = self.connection().execute(
+			'select value from entries where kind = ? and key = ?', (kind, str(key))
+		).fetchone()
+		return json.loads(row[0]) if row else None
+
+_store = MemoryStore()
+
+# store
+def store():
+	return _store
+
+# configure
+def configure(database=None, processes=1):
+
+	# a database file makes state survive restarts and shared by worker
+	# processes; forked workers each with their own memory would number the
+	# same receipts twice
+	global _store
+	if not database and processes > 1:
+		raise ValueError('%d processes need a database file to share their state' % processes)
+	_store = SqliteStore(database) if database else MemoryStore()
+	return _store
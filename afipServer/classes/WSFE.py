@@ -5,6 +5,7 @@ from spyne.protocol.soap import Soap11  # , Soap12
 from spyne.service import ServiceBase
 
 # owner
+from AfipSoap import AfipSoap11
 from Auth import Auth
 from FECAEAConsultar import *
 from FECAEARegInformativo import *
@@ -29,13 +30,13 @@ class WSFE(ServiceBase):
 	__service_url_path__ = '/wsfev1/service.asmx'
 	__tns__ = 'ar'
 	__in_protocol__ = Soap11(validator='lxml')
-	__out_protocol__ = Soap11()
+	__out_protocol__ = AfipSoap11()
 	__name__ = "WSFE"
 	
 	# FECAEAConsultar
 	@srpc(Auth, Integer, Integer, _returns=FECAEAConsultarResponse)
 	def FECAEAConsultar(Auth, Periodo, Orden):
-		return FECAEAConsultar().run()
+		return FECAEAConsultar().run(Periodo, Orden)
 
 	# FECAEARegInformativo
 	@srpc(Auth, _returns=Unicode)
@@ -55,27 +56,27 @@ class WSFE(ServiceBase):
 	# FECAEASolicitar
 	@srpc(Auth, Integer, Integer, _returns=FECAEASolicitarResponse)
 	def FECAEASolicitar(Auth, Periodo, Orden):
-		return FECAEASolicitar.run()
+		return FECAEASolicitar().run(Periodo, Orden)
 		
 	# FECAESolicitar
 	@srpc(Auth, FeCAEReq, _returns=FECAEResponse)
 	def FECAESolicitar(Auth, FeCAEReq):
-		return FECAESolicitar.run(FeCAEReq)		
+		return FECAESolicitar().run(Auth, FeCAEReq)		
 		
 	# FECompConsultar
 	@srpc(Auth, FECompConsultarRequest, _returns=FECompConsultarResponse)
 	def FECompConsultar(Auth, FeCompConsReq):
-		return FECompConsultar().run()		
+		return FECompConsultar().run(FeCompConsReq)		
 		
 	# FECompTotXRequest
 	@srpc(Auth, _returns=FERegXReqResponse)
 	def FECompTotXRequest(Auth):
-		return FERegXReqResponse(RegXReq=250)		
+		return FERegXReqResponse(RegXReq=FECompTotXRequest().run())		
 		
 	# FECompUltimoAutorizado
 	@srpc(Auth, Integer, Integer, _returns=FECompUltimoAutorizadoResponseXp)
 	def FECompUltimoAutorizado(Auth, PtoVta, CbteTipo):
-		return FECompUltimoAutorizado.run()
+		return FECompUltimoAutorizado().run(PtoVta, CbteTipo)
 	
 	# FEDummy
 	@srpc(_returns=FEDummyResponse)
@@ -1,5 +1,7 @@
 from FECAEAConsultarTypes import *
 
+import Storage
+
 # --------------
 # FECAEAConsultar
 # --------------
@@ -9,20 +11,12 @@ class FECAEAConsultar:
 		None
 
 	# run
-	def run(self):
+	def run(self, Periodo, Orden):
 
-		resultGet = ResultGet(			
-			CAEA = "12345678901234", 
-			Periodo = "201011", 
-			Orden = 1, 
-			FchVigDesde = "20101101", 
-			FchVigHasta = "20101115", 
-			FchTopeInf = "20101215", 
-			FchProceso = "20101028"
-		)
-		
-		errs = ArrayOfErr(Err=[])
+		# the CAEA FECAEASolicitar issued for the period, if any
+		caea = Storage.store().get('CAEA', '%d-%d' % (Periodo, Orden))
 		evts = ArrayOfEvt(Evt=[])
-		resp = FECAEAConsultarResponse(ResultGet=resultGet, Errors=errs, Events=evts)
-		return resp
-		
+		if caea is None:
+			errs = ArrayOfErr(Err=[Err(Code=602, Msg='Sin Resultados: - en FECAEAConsultar')])
+			return FECAEAConsultarResponse(Errors=errs, Events=evts)
+		return FECAEAConsultarResponse(ResultGet=ResultGet(**caea), Errors=ArrayOfErr(Err=[]), Events=evts)
@@ -1,3 +1,9 @@
+import calendar
+import datetime
+import random
+
+import Storage
+
 from FECAEASolicitarTypes import *
 
 # --------------
@@ -9,7 +15,28 @@ class FECAEASolicitar:
 		None
 
 	# run
-	def run(self, FeCAEReq):
+	def run(self, Periodo, Orden):
+
+		# one CAEA per period and fortnight, the same one when asked again
+		caea = Storage.store().setdefault('CAEA', '%d-%d' % (Periodo, Orden), issue(Periodo, Orden))
+		errs = ArrayOfErr(Err=[])
+		evts = ArrayOfEvt(Evt=[])
+		return FECAEASolicitarResponse(ResultGet=ResultGet(**caea), Errors=errs, Events=evts)
+
+# issue
+def issue(Periodo, Orden):
 
-		ret = FECAEASolicitar()
-		return ret
+	# the first fortnight runs to the 15th, the second to the end of the month
+	year, month = divmod(Periodo, 100)
+	last = calendar.monthrange(year, month)[1]
+	start = datetime.date(year, month, 1 if Orden == 1 else 16)
+	end = datetime.date(year, month, 15 if Orden == 1 else last)
+	return {
+		'CAEA': '%014d' % random.randint(0, 99999999999999),
+		'Periodo': Periodo,
+		'Orden': Orden,
+		'FchVigDesde': start.strftime('%Y%m%d'),
+		'FchVigHasta': end.strftime('%Y%m%d'),
+		'FchTopeInf': (end + datetime.timedelta(days=8)).strftime('%Y%m%d'),
+		'FchProceso': datetime.datetime.today().strftime('%Y%m%d'),
+	}
@@ -1,9 +1,16 @@
 from errors_utils import Error, Observation, errors_serialize, InvalidRequest
 
 import random
+from decimal import Decimal, ROUND_HALF_UP
 import datetime
+import logging
+
+import Storage
 
 from FECAESolicitarTypes import *
+from FECompTotXRequest import FECompTotXRequest
+
+logger = logging.getLogger('afipServer.wsfe')
 
 # --------------
 # FECAESolicitar
@@ -14,149 +21,193 @@ class FECAESolicitar:
 		None
 
 	# run
-	def run(self, FeCAEReq):
-
-		print("------")
-		print(FeCAEReq)
-		print("------")
-		
-		observations = validate_receipt(FeCAEReq)
-		print("observations", observations)
-		
-		ret = authorize_receipt()
-		print("ret", ret)
-
-		ret = FECAEResponse()		
-		return ret
-		
-db = {}
-if 'tokens' not in db:
-	db['tokens'] = {}
-
-if 'last_auth_doc' not in db:
-	db['last_auth_doc'] = {}
-
-if 'CAE' not in db:
-	db['CAE'] = {}
-
-if 'CAEA' not in db:
-	db['CAEA'] = {}
-
-if 'CAEA_data' not in db:
-	db['CAEA_data'] = {}
-
-if 'receipts' not in db:
-	db['receipts'] = {}
-
-if 'CAEA_unused' not in db:
-	db['CAEA_unused'] = {}
+	def run(self, Auth, FeCAEReq):
+
+		processed = get_datetime().strftime('%Y%m%d%H%M%S')
+		cab = FeCAEReq.FeCabReq
+		details = get_details(FeCAEReq)
+		logger.debug("FeCAEReq %s, %d receipts", cab, len(details))
+
+		try:
+			errors = validate_batch(cab, details)
+			if errors:
+				return rejected_batch(Auth, cab, processed, errors)
+
+			# receipts are checked on their own, only numbering needs the lock
+			observations = [validate_receipt(detail, cab.CbteTipo) for detail in details]
+			results = authorize_batch(cab.PtoVta, cab.CbteTipo, details, observations, processed)
+		except InvalidRequest as e:
+			return rejected_batch(Auth, cab, processed, e.errors)
+
+		approved = sum(1 for detail, receipt, observations in results if receipt is not None)
+		if approved == len(results):
+			resultado = 'A'
+		elif approved == 0:
+			resultado = 'R'
+		else:
+			resultado = 'P'
+		logger.debug("%d-%d: %d of %d approved", cab.PtoVta, cab.CbteTipo, approved, len(results))
+
+		return FECAEResponse(
+			FeCabResp=fe_cab_resp(Auth, cab, processed, resultado),
+			FeDetResp=ArrayOfFECAEDetResponse(FECAEDetResponse=[
+				fe_det_resp(detail, receipt, observations) for detail, receipt, observations in results
+			]),
+		)
+
+# receipt fields kept with the CAE
+RECEIPT_DATA = (
+	'Concepto', 'DocTipo', 'DocNro', 'CbteFch', 'ImpTotal', 'ImpTotConc', 'ImpNeto',
+	'ImpOpEx', 'ImpTrib', 'ImpIVA', 'MonId', 'MonCotiz',
+)
 
-if 'CAEA_used' not in db:
-	db['CAEA_used'] = {}		
-		
 def get_datetime():
 	"""Returns the server's datetime."""
 
 	return datetime.datetime.today()
-	
-def increment_last_auth_doc():
-	"""Increments by 1 the number of the last authorized document."""
-
-	pos, doc_type = 1, 1
-	if pos not in db['last_auth_doc']:
-		db['last_auth_doc'][pos] = {}
 
-	current = get_last_auth_doc()
-	db['last_auth_doc'][pos][doc_type] = current + 1	
+def get_last_auth_doc(pos=1, doc_type=1):
+	"""Returns the number of the last authorized document for the given document type. If no
+	document was authorized yet, returns 0."""
 
-def get_last_auth_doc():
-        """Returns the number of the last authorized document for the given document type. If no
-        document was authorized yet, returns 0."""
-
-        pos, doc_type = 1, 1
-        return db['last_auth_doc'].get(pos, {}).get(doc_type, 0)		
-		
-def generate_cae():
-        """Generates a CAE for the given document number."""
+	return Storage.store().lastCbteNro(pos, doc_type)
 
-        pos, doc_type, doc_num = 1, 1, 1
-        # if get_last_auth_doc() + 1 != doc_num:
-            # raise InvalidReceiptNumber()
-
-        if pos not in db['CAE']:
-            db['CAE'][pos] = {}
-
-        if doc_type not in db['CAE'][pos]:
-            db['CAE'][pos][doc_type] = {}
-
-        db['CAE'][pos][doc_type][doc_num] = random.randint(0, 99999999999999)
-
-        return db['CAE'][pos][doc_type][doc_num]		
-
-def authorize_receipt():
-	"""Authorizes the given receipt. `receipt` is the parsed XML representation received in the
-	request for the `FECAEDetRequest` element, and `xml_namespace` is the name space used in the
-	request. Also, `doc_type` is a code indicating the document type.
-	You can raise `InvalidRequest` exceptions to simulate errors."""
+def get_max_receipts():
+	"""Returns how many receipts a request may carry, as told by `FECompTotXRequest`."""
 
-	pos, doc_type, doc_num = 1, 1, 1
+	return FECompTotXRequest().run()
 
-	# if receipt is not None:
-		# self.validate_receipt(receipt=receipt, xml_namespace=xml_namespace, doc_type=doc_type)
+def get_details(FeCAEReq):
+	"""Returns the `FECAEDetRequest` elements of the request, in order."""
 
-	# generates the CAE if the document number is correct
-	cae = generate_cae()
+	if FeCAEReq.FeDetReq is None:
+		return []
+	return FeCAEReq.FeDetReq.FECAEDetRequest or []
 
-	cae_due_date = get_datetime() + datetime.timedelta(days=10)
+def get_cuit(Auth):
+	"""Returns the CUIT of the request's `Auth` as a number, 0 if it is not one."""
 
-	if pos not in db['receipts']:
-		db['receipts'][pos] = {}
+	cuit = ''.join(c for c in (Auth.Cuit if Auth is not None and Auth.Cuit else '') if c.isdigit())
+	return int(cuit) if cuit else 0
 
-	if doc_type not in db['receipts'][pos]:
-		db['receipts'][pos][doc_type] = {}
-
-	db['receipts'][pos][doc_type][doc_num] = {
-		'authorization_code': cae,
-		'due_date': cae_due_date,
-		'process_datetime': get_datetime(),
-		'authorization_type': 'CAE',
-	}
-
-	increment_last_auth_doc()
-
-	return db['receipts'][pos][doc_type][doc_num]
-
-def validate_receipt(FeCAEReq):
-	"""Called when a receipt is received for authorization. `receipt` is the parsed XML
-	representation received in the request for the `FECAEDetRequest` element, and `xml_namespace`
-	is the name space used in the request. Also, `doc_type` is a code indicating the document type.
+def generate_cae():
+	"""Generates a CAE, stored with the receipt it authorizes."""
+
+	return random.randint(0, 99999999999999)
+
+def validate_batch(cab, details):
+	"""Checks the request header against its details, returns the errors that reject the whole
+	batch."""
+
+	if cab is None:
+		return [Error(code=10000, msg='El campo FeCabReq es obligatorio.')]
+
+	if cab.CantReg != len(details):
+		return [Error(code=10001, msg='El campo CantReg debe ser igual a la cantidad de registros informados en FeDetReq.')]
+
+	max_receipts = get_max_receipts()
+	if len(details) > max_receipts:
+		return [Error(code=10002, msg='La cantidad de registros excede el maximo permitido por request (%d). Consultar metodo FECompTotXRequest.' % max_receipts)]
+
+	return []
+
+def authorize_batch(pos, doc_type, details, observations, processed):
+	"""Authorizes the receipts of a batch in order, within one transaction of the given point of
+	sale and document type: each one must follow the last authorized number, a rejected receipt
+	does not take its number. Returns (detail, receipt, observations) per receipt, `receipt` is
+	None when it was rejected."""
+
+	due_date = (get_datetime() + datetime.timedelta(days=10)).strftime('%Y%m%d')
+	results = []
+
+	with Storage.store().transaction(pos, doc_type) as sequence:
+		for detail, detail_observations in zip(details, observations):
+
+			if detail.CbteDesde != sequence.last + 1 or detail.CbteHasta != detail.CbteDesde:
+				detail_observations = [Observation(code=10016, msg='El numero o fecha del comprobante no se corresponde con el proximo a autorizar. Consultar metodo FECompUltimoAutorizado.')]
+
+			if detail_observations:
+				results.append((detail, None, detail_observations))
+				continue
+
+			receipt = sequence.add(
+				detail.CbteDesde,
+				generate_cae(),
+				due_date,
+				processed=processed,
+				data={name: getattr(detail, name) for name in RECEIPT_DATA},
+			)
+			results.append((detail, receipt, None))
+
+	return results
+
+def rejected_batch(Auth, cab, processed, errors):
+	"""Returns the response of a batch rejected as a whole."""
+
+	return FECAEResponse(
+		FeCabResp=fe_cab_resp(Auth, cab, processed, 'R'),
+		Errors=ArrayOfErr(Err=[Err(Code=int(e.code), Msg=e.msg) for e in errors]),
+	)
+
+def fe_cab_resp(Auth, cab, processed, resultado):
+	"""Returns the `FeCabResp` of a batch."""
+
+	return FeCabResp(
+		Cuit=get_cuit(Auth),
+		PtoVta=cab.PtoVta if cab is not None else 0,
+		CbteTipo=cab.CbteTipo if cab is not None else 0,
+		FchProceso=processed,
+		CantReg=cab.CantReg if cab is not None else 0,
+		Resultado=resultado,
+		Reproceso='N',
+	)
+
+def fe_det_resp(detail, receipt, observations):
+	"""Returns the `FECAEDetResponse` of a receipt, with its CAE when it was authorized."""
+
+	return FECAEDetResponse(
+		Concepto=detail.Concepto,
+		DocTipo=detail.DocTipo,
+		DocNro=detail.DocNro,
+		CbteDesde=detail.CbteDesde,
+		CbteHasta=detail.CbteHasta,
+		CbteFch=detail.CbteFch,
+		Resultado='A' if receipt is not None else 'R',
+		Observaciones=ArrayOfObs(Obs=[Obs(Code=int(o.code), Msg=o.msg) for o in observations]) if observations else None,
+		CAE=receipt['cae'] if receipt is not None else None,
+		CAEFchVto=receipt['caeFchVto'] if receipt is not None else None,
+	)
+
+def amount(value):
+	"""Returns an amount of the request as a `Decimal`, they arrive as floats."""
+
+	return Decimal(str(value)) if value is not None else Decimal('0.00')
+
+def validate_receipt(receipt, doc_type):
+	"""Called when a receipt is received for authorization. `receipt` is the parsed
+	`FECAEDetRequest` element and `doc_type` is the `CbteTipo` of the request. Returns the
+	observations that reject it, an empty list when it passes.
 	You can raise `InvalidRequest` exceptions to simulate errors."""
 
-	from decimal import Decimal
-
 	vat_rates = {
-		'3': Decimal('0.00'),
-		'4': Decimal('10.50'),
-		'5': Decimal('21.00'),
-		'6': Decimal('27.00'),
-		'8': Decimal('5.00'),
-		'9': Decimal('2.50'),
+		3: Decimal('0.00'),
+		4: Decimal('10.50'),
+		5: Decimal('21.00'),
+		6: Decimal('27.00'),
+		8: Decimal('5.00'),
+		9: Decimal('2.50'),
 	}
-	
-	print("FeCAEReq", FeCAEReq)
-	print("FeCAEReq.FeDetReq.FECAEDetRequest.ImpTotal", FeCAEReq.FeDetReq.FECAEDetRequest.ImpTotal)
 
-	CATEGORY_C_DOC_CODES = ['11', '13']
+	CATEGORY_C_DOC_CODES = [11, 12, 13, 15]
 
-	total = FeCAEReq.FeDetReq.FECAEDetRequest.ImpTotal
-	other_taxes = FeCAEReq.FeDetReq.FECAEDetRequest.ImpTrib
-	taxable_net_amount = FeCAEReq.FeDetReq.FECAEDetRequest.ImpNeto
-	exempt_net_amount = FeCAEReq.FeDetReq.FECAEDetRequest.ImpOpEx
-	non_taxable_net_amount = FeCAEReq.FeDetReq.FECAEDetRequest.ImpTotConc
-	tax_total = FeCAEReq.FeDetReq.FECAEDetRequest.ImpIVA
-	vat_list = FeCAEReq.FeDetReq.FECAEDetRequest.Iva
+	total = amount(receipt.ImpTotal)
+	other_taxes = amount(receipt.ImpTrib)
+	taxable_net_amount = amount(receipt.ImpNeto)
+	exempt_net_amount = amount(receipt.ImpOpEx)
+	non_taxable_net_amount = amount(receipt.ImpTotConc)
+	tax_total = amount(receipt.ImpIVA)
+	vat_list = (receipt.Iva.AlicIva or []) if receipt.Iva is not None else None
 
-	doc_type = '11'
 	observations = []
 	
 	# CATEGORY_C
@@ -177,47 +228,42 @@ def validate_receipt(FeCAEReq):
 		if vat_list is not None:
 			observations.append(Observation(code='10071', msg='Para comprobantes tipo C el objeto IVA no debe informarse.'))
 
-		if len(observations) > 0:
-			return observations
+		return observations
 	
 	# NOT CATEGORY_C
-	if doc_type not in CATEGORY_C_DOC_CODES:
+	tax_base = Decimal('0.00')
+	tax_total_from_vats = Decimal('0.00')
+
+	if vat_list is not None:
+		for vat in vat_list:
 	
-		tax_base = Decimal('0.00')
-		tax_total_from_vats = Decimal('0.00')
+			vat_id = vat.Id
+			vat_tax_base = amount(vat.BaseImp)
+			vat_amount = amount(vat.Importe)
 
-		if vat_list is not None:
-			for vat in vat_list:
-		
-				vat_id = vat.AlicIva.Id				
-				vat_tax_base = Decimal(vat.AlicIva.BaseImp)				
-				vat_amount = Decimal(vat.AlicIva.Importe)
-
-				if vat_tax_base == Decimal('0.00'):
-					observations=[Observation(code='10020', msg='El  campo  BaseImp  en AlicIVA es obligatorio  y debe ser mayor a 0 cero.')]
-					return observations
-
-				expected_vat_amount = Decimal(str(round(vat_tax_base * vat_rates[vat_id] / Decimal('100.00'), 2)))
-				vat_amount_error_tolerance = Decimal('0.01')
-				if  vat_amount < expected_vat_amount - vat_amount_error_tolerance or vat_amount > expected_vat_amount + vat_amount_error_tolerance:
-					observations=[Observation(code='10051', msg='Los importes informados en AlicIVA no se corresponden con los porcentajes.')]
-					return observations
-
-				if vat_id != '3' and tax_total == Decimal('0.00'):
-					observations=[Observation(code='10018', msg='Si ImpIva es igual a 0 el objeto Iva y AlicIva son obligatorios. Id iva = 3 (iva 0)')]
-					return observations
-
-				tax_base += vat_tax_base
-				tax_total_from_vats += vat_amount
-				
-		else:
-			if taxable_net_amount > Decimal('0.00'):
-				observations=[Observation(code='10070', msg='Si ImpNeto es mayor a 0 el objeto IVA es obligatorio.')]
+			if vat_tax_base == Decimal('0.00'):
+				observations=[Observation(code='10020', msg='El  campo  BaseImp  en AlicIVA es obligatorio  y debe ser mayor a 0 cero.')]
+				return observations
+
+			expected_vat_amount = (vat_tax_base * vat_rates.get(vat_id, Decimal('0.00')) / Decimal('100.00')).quantize(Decimal('0.01'), ROUND_HALF_UP)
+			vat_amount_error_tolerance = Decimal('0.01')
+			if vat_id not in vat_rates or vat_amount < expected_vat_amount - vat_amount_error_tolerance or vat_amount > expected_vat_amount + vat_amount_error_tolerance:
+				observations=[Observation(code='10051', msg='Los importes informados en AlicIVA no se corresponden con los porcentajes.')]
 				return observations
+
+			if vat_id != 3 and tax_total == Decimal('0.00'):
+				observations=[Observation(code='10018', msg='Si ImpIva es igual a 0 el objeto Iva y AlicIva son obligatorios. Id iva = 3 (iva 0)')]
+				return observations
+
+			tax_base += vat_tax_base
+			tax_total_from_vats += vat_amount
+			
+	else:
+		if taxable_net_amount > Decimal('0.00'):
+			observations=[Observation(code='10070', msg='Si ImpNeto es mayor a 0 el objeto IVA es obligatorio.')]
+			return observations
 		
 	# Check Totals
-	observations = []
-
 	total_obtained = non_taxable_net_amount + taxable_net_amount + exempt_net_amount + other_taxes + tax_total
 
 	if total_obtained != total:
@@ -229,6 +275,4 @@ def validate_receipt(FeCAEReq):
 	if taxable_net_amount != tax_base:
 		observations.append(Observation(code='10061', msg='La suma de los campos BaseImp en AlicIva debe ser igual al valor ingresado en ImpNeto.'))
 
-	if len(observations) > 0:
-		return observations
-		
+	return observations
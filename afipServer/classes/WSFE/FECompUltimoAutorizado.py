@@ -3,6 +3,8 @@ from spyne.model.primitive import Integer
 from spyne.model.primitive import Unicode
 from Auth import *
 
+import Storage
+
 # class Auth(ComplexModel):
 		# Token = Unicode
 		# Sign = Unicode
@@ -35,10 +37,10 @@ class FECompUltimoAutorizado:
 		None
 
 	# run
-	def run(self):	
+	def run(self, PtoVta, CbteTipo):
 		ret = FECompUltimoAutorizadoResponseXp()
-		ret.PtoVta = 1
-		ret.CbteTipo = 1
-		ret.CbteNro = 2
+		ret.PtoVta = PtoVta
+		ret.CbteTipo = CbteTipo
+		ret.CbteNro = Storage.store().lastCbteNro(PtoVta, CbteTipo)
 		return ret
 
@@ -1,10 +1,12 @@
-import logging
-
 from flask import Flask, jsonify, request
 from spyne import Application, rpc, Iterable, Integer, Unicode
 from spyne.server.wsgi import WsgiApplication
 from wsgiref.simple_server import make_server
 from spyne.util.wsgi_wrapper import WsgiMounter
+from PooledServer import LoggedRequestHandler, PooledWSGIServer, prefork
+import ServerLog
+import Storage
+from AfipSoap import AfipSoap11
 
 # owner
 from WSFE import *
@@ -18,18 +20,34 @@ class WebServer:
 		self.host = "0.0.0.0"
 		self.port = 5001
 		self.server = ''
+		# sqlite file for receipts, numbering and CAEA state; empty keeps them
+		# in memory until restart, for a single process only
 		self.database = ''
+
+		# serving mode: one of each is the plain wsgiref server, one request at
+		# a time over HTTP/1.0; more threads or processes serve HTTP/1.1 with
+		# keep-alive from a pool of worker threads in each worker process
+		self.threads = 1
+		self.processes = 1
+		self.keepAlive = 15
+
+		# logging: sampled envelopes, capped, written off the request thread and
+		# rate limited; 'debug' logs every envelope in full, for development only
+		self.logMode = ServerLog.PERFORMANCE
+		self.logSampleRate = 0.01
+		self.logMaxEnvelope = ServerLog.MAX_ENVELOPE
+		self.logMaxPerSecond = 200
  
 	# run
 	def run(self):
 	
-		logging.basicConfig(level=logging.DEBUG)
-		logging.getLogger('spyne.protocol.xml').setLevel(logging.DEBUG)
+		ServerLog.configure(self.logMode, self.logSampleRate, self.logMaxEnvelope, self.logMaxPerSecond)
+		Storage.configure(self.database, self.processes)
 
-		WSFE.event_manager.add_listener('method_return_string', on_method_return_string)
-		
 		wsaa = Application([WSAA], 'http://wsaa.view.sua.dvadac.desein.afip.gov', in_protocol=Soap11(validator='lxml'), out_protocol=Soap11())
-		wsfe = Application([WSFE], 'http://ar.gov.afip.dif.FEV1/', in_protocol=Soap11(validator='lxml'), out_protocol=Soap11())
+		wsfe = Application([WSFE], 'http://ar.gov.afip.dif.FEV1/', in_protocol=Soap11(validator='lxml'), out_protocol=AfipSoap11())
+		ServerLog.listen(wsaa)
+		ServerLog.listen(wsfe)
 
 		wsgi_wsfe = WsgiMounter({
 			'service.asmx': wsfe
@@ -44,11 +62,19 @@ class WebServer:
 			'ws': wsaa
 		})
 
-		server = make_server(self.host, self.port, wsgi_root)
+		if self.threads > 1 or self.processes > 1:
+			server = PooledWSGIServer((self.host, self.port), self.threads, self.keepAlive)
+			server.set_app(wsgi_root)
+		else:
+			server = make_server(self.host, self.port, wsgi_root, handler_class=LoggedRequestHandler)
 		print("Server Started")
+		print("Serving with {0} process(es) of {1} thread(s)".format(self.processes, self.threads))
 		print("WSFE is at: http://{0}:{1}{2}".format(self.host, self.port, "/wsfev1/service.asmx?WSDL"))
 		print("WSAA is at: http://{0}:{1}{2}".format(self.host, self.port, '/ws/services/LoginCms?WSDL'))
-		server.serve_forever()
+		if self.processes > 1:
+			prefork(server, self.processes)
+		else:
+			server.serve_forever()
 		
 		
 		
@@ -65,10 +91,3 @@ class WebServer:
 
 		# if __name__ == '__main__':
 			# app.run()
-		
-		
-		
-
-def on_method_return_string(ctx):
-	print("using listener")
-	ctx.out_string[0] = ctx.out_string[0].replace("tns:", "")
\ No newline at end of file
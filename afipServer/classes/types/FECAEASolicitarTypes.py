@@ -1,5 +1,6 @@
 from spyne.model.primitive import Unicode, Integer, Double, Long, Short
 from spyne.model.complex import Iterable, ComplexModel  # Array
+from FECompConsultarTypes import ArrayOfErr, ArrayOfEvt
 
 
 # ResultGet
@@ -53,6 +53,10 @@ class FECAEDetResponse(FEDetResponse):
     CAE = Unicode(min_occurs=0, max_occurs=1)
     CAEFchVto = Unicode(min_occurs=0, max_occurs=1)
 
+# ArrayOfFECAEDetResponse
+class ArrayOfFECAEDetResponse(ComplexModel):
+    FECAEDetResponse = FECAEDetResponse.customize(min_occurs=0, max_occurs='unbounded', nillable=True)
+
 # FeCabResp
 class FeCabResp(ComplexModel):
     _type_info = [
@@ -69,7 +73,7 @@ class FeCabResp(ComplexModel):
 class FECAEResponse(ComplexModel):
     _type_info = [
         ('FeCabResp', FeCabResp),
-        ('FeDetResp', FECAEDetResponse.customize(min_occurs=0, max_occurs='unbounded', nillable=True)),
+        ('FeDetResp', ArrayOfFECAEDetResponse),
         ('Errors', ArrayOfErr),
         ('Events', ArrayOfEvt),
     ]
@@ -146,6 +150,9 @@ class FEDetRequest(ComplexModel):
 class FECAEDetRequest(FEDetRequest):
     pass
 
+class ArrayOfFECAEDetRequest(ComplexModel):
+    FECAEDetRequest = FECAEDetRequest.customize(min_occurs=0, max_occurs='unbounded', nillable=True)
+
 class FECAECabRequest(ComplexModel):
     _type_info = [
         ('CantReg', Integer(min_occurs=1, max_occurs=1),),
@@ -156,5 +163,5 @@ class FECAECabRequest(ComplexModel):
 class FeCAEReq(ComplexModel):
     _type_info = [
         ('FeCabReq', FECAECabRequest),
-        ('FeDetReq', FECAEDetRequest.customize(min_occurs=0, max_occurs='unbounded', nillable=True))
+        ('FeDetReq', ArrayOfFECAEDetRequest)
     ]	
\ No newline at end of file
@@ -1,3 +1,4 @@
+import argparse
 import sys
 sys.path.insert(0, './classes')
 sys.path.insert(0, './classes/types')
@@ -7,6 +8,19 @@ from WebServer import WebServer
 
 if __name__ == "__main__":
 
+	parser = argparse.ArgumentParser()
+	parser.add_argument('threads', nargs='?', type=int, default=1)
+	parser.add_argument('processes', nargs='?', type=int, default=1)
+	parser.add_argument('--debug', action='store_true', help='log every envelope in full')
+	parser.add_argument('--sample', type=float, default=0.01, help='share of requests logged')
+	parser.add_argument('--database', default='', help='sqlite file, state survives restarts')
+	args = parser.parse_args()
+
 	server = WebServer()
 	server.port = 5002
-	server.run()
\ No newline at end of file
+	server.threads = args.threads
+	server.processes = args.processes
+	server.logMode = 'debug' if args.debug else 'performance'
+	server.logSampleRate = args.sample
+	server.database = args.database
+	server.run()
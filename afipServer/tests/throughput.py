@@ -0,0 +1,95 @@
+import argparse
+import http.client
+import multiprocessing
+import time
+
+# raw SOAP, the client side must cost as little as possible
+ENVELOPE = (
+	'<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/" '
+	'xmlns:ar="http://ar.gov.afip.dif.FEV1/"><soap:Body>{0}</soap:Body></soap:Envelope>'
+)
+BODIES = {
+	'FEDummy': '<ar:FEDummy/>',
+	'FEParamGetTiposIva': (
+		'<ar:FEParamGetTiposIva><ar:Auth xmlns:au="Auth"><au:Token>t</au:Token>'
+		'<au:Sign>s</au:Sign><au:Cuit>20111111112</au:Cuit></ar:Auth></ar:FEParamGetTiposIva>'
+	),
+}
+
+# client
+def client(host, port, operation, duration, keepAlive, results):
+
+	body = ENVELOPE.format(BODIES[operation]).encode()
+	headers = {'Content-Type': 'text/xml; charset=utf-8', 'SOAPAction': operation}
+	if not keepAlive:
+		headers['Connection'] = 'close'
+
+	done = 0
+	errors = 0
+	latencies = []
+	connection = http.client.HTTPConnection(host, port, timeout=30)
+	end = time.monotonic() + duration
+	while time.monotonic() < end:
+		start = time.monotonic()
+		try:
+			connection.request('POST', '/wsfev1/service.asmx', body, headers)
+			response = connection.getresponse()
+			response.read()
+			if response.status != 200:
+				errors += 1
+			else:
+				done += 1
+				latencies.append(time.monotonic() - start)
+			if response.will_close:
+				connection.close()
+		except (OSError, http.client.HTTPException):
+			errors += 1
+			connection.close()
+	connection.close()
+	results.put((done, errors, latencies))
+
+# percentile
+def percentile(values, p):
+	if not values:
+		return 0
+	values = sorted(values)
+	return values[min(len(values) - 1, int(len(values) * p))]
+
+if __name__ == '__main__':
+
+	# start the server first, e.g. python tests/main.py 16 4 for 4 processes of 16 threads
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--host', default='127.0.0.1')
+	parser.add_argument('--port', type=int, default=5002)
+	parser.add_argument('--clients', type=int, default=16, help='client processes')
+	parser.add_argument('--duration', type=float, default=10)
+	parser.add_argument('--operation', default='FEDummy', choices=sorted(BODIES))
+	parser.add_argument('--close', action='store_true', help='a new connection per request')
+	args = parser.parse_args()
+
+	results = multiprocessing.Queue()
+	clients = [
+		multiprocessing.Process(
+			target=client,
+			args=(args.host, args.port, args.operation, args.duration, not args.close, results),
+		)
+		for i in range(args.clients)
+	]
+	for c in clients:
+		c.start()
+
+	done = 0
+	errors = 0
+	latencies = []
+	for c in clients:
+		d, e, l = results.get()
+		done += d
+		errors += e
+		latencies.extend(l)
+	for c in clients:
+		c.join()
+
+	print('{0}: {1} clients, {2:.0f} req/s, p50 {3:.1f} ms, p99 {4:.1f} ms, {5} errors'.format(
+		args.operation, args.clients, done / args.duration,
+		percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000, errors,
+	))